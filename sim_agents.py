@@ -0,0 +1,206 @@
+import math
+import time
+import random
+import argparse
+
+# --- Game State & Agents (shared by simulation.py and simulation_spatial.py) ---
+# GameState is a flat copy of everything a game changes: strength and position
+# (section or hex) per unit in Game.units order, the owner list (static, shared
+# by every fork), medals, mana, hands, deck piles, dice buffer and turn counter.
+# Game.fork() takes one and Game.restore() writes it back, rebuilding the live
+# rosters from it: O(units + cards), no Unit objects are copied.
+# Agents pick the command card of a turn. Game(agents={faction code: agent})
+# asks agent.choose_card(game, player number) at the start of that faction's
+# turns for a (hand index, option); None leaves it to the built-in heuristic
+# (sim_cards.choose). Agents can be given as specs ("rollout:8:6") so they fit
+# in game_kwargs and store keys. Without agents (the default) play_turn makes
+# exactly the same calls as before: same games, same results.
+
+DEFAULT_ROLLOUTS = 8
+DEFAULT_DEPTH = 6 # Half-turns played after the agent's own
+
+class GameState:
+    __slots__ = ('strength', 'pos', 'owner', 'medals', 'mana', 'turn', 'hands', 'deck', 'dice')
+
+    def __init__(self, strength, pos, owner, medals, mana, turn, hands, deck, dice):
+        self.strength = strength # [current strength] per unit
+        self.pos = pos # [section or (col, row)] per unit
+        self.owner = owner # [player number] per unit
+        self.medals = medals # (player 1, player 2)
+        self.mana = mana # (player 1, player 2)
+        self.turn = turn
+        self.hands = hands # (player 1 cards, player 2 cards)
+        self.deck = deck # Deck.state(), None in abstract card mode
+        self.dice = dice # DiceEngine.state()
+
+def outcome(game, player_num, winner):
+    # Value of a rollout's end for player_num: 1 won, 0 lost, evaluate() if unfinished
+    if winner is None:
+        return evaluate(game.fork(), player_num)
+    return 0.5 if winner == 0 else float(winner == player_num)
+
+def evaluate(state, player_num):
+    # Value of an unfinished game for player_num in (0, 1): medal lead and share of the strength left
+    mine = theirs = 0
+    for strength, owner in zip(state.strength, state.owner):
+        if owner == player_num:
+            mine += strength
+        else:
+            theirs += strength
+    lead = state.medals[player_num - 1] - state.medals[2 - player_num] # At most 4 while nobody has won
+    share = mine / (mine + theirs) if mine + theirs else 0.5
+    return 0.5 * (0.5 + lead / 10) + 0.5 * share
+
+class HeuristicAgent:
+    # The built-in AI, as an agent: always defers to sim_cards.choose
+    def choose_card(self, game, player_num):
+        return None
+
+class RolloutAgent:
+    # Monte Carlo lookahead: the heuristic's card and every playable card/option
+    # of the hand are played from a fork of the game and followed by `depth`
+    # half-turns of heuristic play, `rollouts` times. Every candidate rolls the
+    # same private dice (common random numbers; never the game's own buffered
+    # faces), so each rollout gives a paired difference against the heuristic.
+    # A card replaces the heuristic's only if its mean difference beats its
+    # standard error: a plain argmax of noisy playouts is close to a random pick
+    # and loses to the heuristic. Hands are open to it.
+    def __init__(self, rollouts=DEFAULT_ROLLOUTS, depth=DEFAULT_DEPTH):
+        self.rollouts = rollouts
+        self.depth = depth
+        self.decisions = 0
+        self.seconds = 0.0
+
+    def candidates(self, game, player_num):
+        # (hand index, option) the player can afford, one per distinct card option
+        mana = game.turn_mana(player_num)
+        seen = set()
+        found = []
+        for i, card in enumerate(game.hand(player_num)):
+            for o, option in enumerate(card.options):
+                if option.playable and option.mana_cost <= mana and (card.id, o) not in seen:
+                    seen.add((card.id, o))
+                    found.append((i, option))
+        return found
+
+    def choose_card(self, game, player_num):
+        candidates = self.candidates(game, player_num)
+        if len(candidates) < 2:
+            return candidates[0] if candidates else None
+        start = time.perf_counter()
+        seed = game.rng.getrandbits(64) # From the game's stream: reproducible per game
+        state = game.fork()
+        rng, agents, events = game.rng, game.agents, game.events
+        game.agents = game.events = None # Rollouts are heuristic play, unlogged
+        best, best_value = None, 0.0
+        try:
+            baseline = self.rollout_values(game, state, player_num, seed, None)
+            for choice in candidates:
+                diffs = [v - b for v, b in zip(self.rollout_values(game, state, player_num, seed, choice), baseline)]
+                n = len(diffs)
+                mean = sum(diffs) / n
+                se = math.sqrt(sum((d - mean) ** 2 for d in diffs) / (n - 1) / n) if n > 1 else 0.0
+                if mean - se > best_value:
+                    best, best_value = choice, mean - se
+        finally:
+            game.use_rng(rng)
+            game.restore(state) # After use_rng: puts the game's dice buffer back
+            game.agents, game.events = agents, events
+        self.decisions += 1
+        self.seconds += time.perf_counter() - start
+        return best
+
+    def rollout_values(self, game, state, player_num, seed, choice):
+        # One outcome per rollout of choice (None: the heuristic's card)
+        values = []
+        for r in range(self.rollouts):
+            game.restore(state)
+            game.use_rng(random.Random(seed + r))
+            values.append(outcome(game, player_num, game.advance(player_num, self.depth + 1, choice)))
+        return values
+
+AGENTS = {'heuristic': HeuristicAgent, 'rollout': RolloutAgent}
+
+def make_agent(spec):
+    # "heuristic", "rollout" or "rollout:ROLLOUTS:DEPTH"; agent objects pass through
+    if not isinstance(spec, str):
+        return spec
+    name, *args = spec.split(":")
+    if name not in AGENTS:
+        raise ValueError(f"Unknown agent '{spec}' (use {', '.join(AGENTS)})")
+    return AGENTS[name](*(int(a) for a in args))
+
+def make_agents(agents):
+    # Game's agents argument -> {faction code: agent}, None without any
+    return {code: make_agent(spec) for code, spec in agents.items()} if agents else None
+
+def time_fork(game, repeats=1000):
+    # Seconds per fork() + restore() of a game
+    state = game.fork()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        game.restore(game.fork())
+    elapsed = time.perf_counter() - start
+    game.restore(state)
+    return elapsed / repeats
+
+if __name__ == "__main__":
+    # The engines import this module: they are only imported to run the benchmark
+    import sim_data
+    import sim_runner
+    import sim_sweep
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faction", required=True, help="Faction played by the agent")
+    parser.add_argument("--agent", default="rollout", help="heuristic, rollout or rollout:ROLLOUTS:DEPTH")
+    parser.add_argument("--opponents", default=None, help="Comma separated faction codes (default: every other faction)")
+    parser.add_argument("--engine", choices=list(sim_sweep.ENGINES), default="simulation")
+    parser.add_argument("--games", type=int, default=20, help="Games per opponent, with and without the agent")
+    parser.add_argument("--heroes", action="store_true")
+    parser.add_argument("--seed", type=int, default=0, help="Shared by both runs (common random numbers)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mirror", action="store_true", help="Also play every game with seats swapped on the same dice")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args()
+
+    data = sim_data.load(args.data_dir)
+    if args.faction not in data.factions_by_code:
+        parser.error(f"Unknown faction: {args.faction}")
+    try:
+        make_agent(args.agent)
+    except (ValueError, TypeError) as e:
+        parser.error(str(e))
+    if args.opponents:
+        opponents = [data.factions_by_code[code] for code in args.opponents.split(",")]
+    else:
+        opponents = [f for f in data.factions if f['code'] not in sim_sweep.EXCLUDED_FACTIONS and f['code'] != args.faction]
+    game_cls = sim_sweep.ENGINES[args.engine]
+    pairs = [(data.factions_by_code[args.faction], opp) for opp in opponents]
+
+    runs = {}
+    for label, kwargs in (("heuristic", {}), (args.agent, {'agents': {args.faction: args.agent}})):
+        start = time.perf_counter()
+        tallies = sim_runner.run_matchups(game_cls, pairs, args.games, data.units, data.cards, args.heroes, args.seed,
+                                          args.workers, game_kwargs=kwargs, snapshot=data.path, mirror=args.mirror)
+        runs[label] = (tallies, time.perf_counter() - start)
+
+    game = game_cls(pairs[0][0], pairs[0][1], data.units, data.cards, args.heroes,
+                    rng=sim_runner.game_rng(args.seed, pairs[0][0]['code'], pairs[0][1]['code'], 0))
+    print(f"# Agente {args.agent} ({args.faction}, {game_cls.engine}) contra la heurística | Semilla: {args.seed}")
+    print(f"Estado: {len(game.units)} unidades | fork + restore: {time_fork(game) * 1e6:.1f} µs\n")
+    print("| rival | heurística | agente | diferencia |")
+    print("|---|---|---|---|")
+    totals = {label: sim_runner.empty_tally() for label in runs}
+    for p, (_, opp) in enumerate(pairs):
+        base, agent = runs["heuristic"][0][p], runs[args.agent][0][p]
+        for label in runs:
+            sim_runner.merge_tally(totals[label], runs[label][0][p])
+        print(f"| {opp['code']} | {sim_runner.pair_score(base):.1%} | {sim_runner.pair_score(agent):.1%} | "
+              f"{sim_runner.pair_score(agent) - sim_runner.pair_score(base):+.1%} |")
+    base, agent = totals["heuristic"], totals[args.agent]
+    lo, hi = sim_runner.wilson_interval(sim_runner.pair_score(agent), agent['games'])
+    print(f"| all | {sim_runner.pair_score(base):.1%} | {sim_runner.pair_score(agent):.1%} [{lo:.1%}, {hi:.1%}] | "
+          f"{sim_runner.pair_score(agent) - sim_runner.pair_score(base):+.1%} |\n")
+    for label, (tallies, seconds) in runs.items():
+        games = sum(t['games'] for t in tallies)
+        print(f"{label}: {games} partidas en {seconds:.1f} s ({1000 * seconds / games:.1f} ms/partida)")
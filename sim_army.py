@@ -0,0 +1,241 @@
+import os
+import re
+import math
+import argparse
+
+import sim_data
+import sim_runner
+import sim_store
+import sim_sweep
+
+# --- Point-Buy Armies (scenarios.json budgets, either engine) ---
+# An army is ((unit id, copies), ...) in units.json order, handed to the games
+# as game_kwargs['armies'][faction code]. A legal army spends at most the gold
+# budget (unit `cost`), has no unit of an excluded type, at most max_copies of
+# each unit and one hero. Only maximal armies (nothing affordable left to add)
+# are candidates.
+# The search is successive halving: every round plays the surviving armies
+# eta times more games against the opponents' box armies and keeps the best
+# 1/eta. Results are cached per composition, so a survivor only plays the
+# games it has not played yet (and a results store carries them across runs).
+# Every candidate plays the same game indexes: common random numbers.
+
+DEFAULT_MAX_COPIES = 3
+SETUP_BUDGET = re.compile(r"(\d+) Gold per side", re.IGNORECASE)
+SETUP_EXCLUDE = re.compile(r"No (\w+)", re.IGNORECASE)
+
+def load_scenarios(data_dir=None):
+    return sim_data.load_json(os.path.join(data_dir or sim_data.DEFAULT_DATA_DIR, "scenarios.json"))
+
+def scenario_rules(scenario):
+    # (gold budget, excluded unit types) from the English setup text,
+    # e.g. "Standard map. 30 Gold per side. No Elite." -> (30, {'elite'})
+    setup = scenario['setup']['en']
+    budget = SETUP_BUDGET.search(setup)
+    if not budget:
+        raise ValueError(f"scenarios.json: {scenario['id']} sets no gold budget ({setup})")
+    return int(budget.group(1)), {t.lower() for t in SETUP_EXCLUDE.findall(setup)}
+
+def is_hero(u):
+    # Marked as a hero (subtype or trait), as Unit.__init__ reads it. 6+ gold alone
+    # only makes a unit fight as elite: it is not limited to one copy
+    return u.get('subtype') == 'hero' or "Hero" in u.get('traits', [])
+
+def unit_type(u, unit_cls):
+    # The type the engine's Unit (Game.unit_cls) ends up with
+    return unit_cls(u, u['faction']).type.value
+
+def unit_pool(units_data, faction_code, unit_cls, excluded=(), use_heroes=False):
+    # The faction's units that can be bought: base set, plus its hero with use_heroes
+    pool = []
+    for u in units_data:
+        if u['faction'] != faction_code or not isinstance(u.get('cost'), int) or unit_type(u, unit_cls) in excluded:
+            continue
+        if u['expansion'] == 'base' or (use_heroes and is_hero(u)):
+            pool.append(u)
+    return pool
+
+def legal_armies(pool, budget, max_copies=DEFAULT_MAX_COPIES):
+    # Every maximal army of the pool within budget (more copies of earlier units first)
+    limits = [1 if is_hero(u) else max_copies for u in pool]
+    costs = [u['cost'] for u in pool]
+    armies = []
+    counts = [0] * len(pool)
+
+    def walk(i, left):
+        if i == len(pool):
+            maximal = all(counts[j] == limits[j] or costs[j] > left for j in range(len(pool)))
+            if maximal and any(counts):
+                armies.append(tuple((pool[j]['id'], n) for j, n in enumerate(counts) if n))
+            return
+        for n in range(min(limits[i], left // costs[i] if costs[i] else limits[i]), -1, -1):
+            counts[i] = n
+            walk(i + 1, left - n * costs[i])
+        counts[i] = 0
+
+    walk(0, budget)
+    return armies
+
+def army_cost(army, units_data):
+    costs = {u['id']: u['cost'] for u in units_data}
+    return sum(costs[unit_id] * n for unit_id, n in army)
+
+class ArmyEvaluator:
+    # Games of one faction's candidate armies (always moving first, or both
+    # seats with mirror) against fixed opponents, cached per composition
+    def __init__(self, game_cls, faction, opponents, data, pool, seed=0, use_heroes=False, workers=1,
+                 game_kwargs=None, store=None, mirror=False):
+        self.game_cls = game_cls
+        self.pairs = [(faction, opp) for opp in opponents]
+        self.data = data
+        self.pool = pool # sim_runner.worker_pool
+        self.seed = seed
+        self.use_heroes = use_heroes
+        self.workers = max(1, workers)
+        self.game_kwargs = game_kwargs or {}
+        self.store = store
+        self.mirror = mirror
+        self.cache = {} # army -> one tally per opponent
+        self.keys = {} # army -> store key per opponent
+        self.played = 0
+
+    def kwargs(self, army):
+        return dict(self.game_kwargs, armies={self.pairs[0][0]['code']: army})
+
+    def tallies(self, army):
+        if army not in self.cache:
+            self.cache[army] = [sim_runner.empty_tally() for _ in self.pairs]
+            if self.store:
+                self._load(army)
+        return self.cache[army]
+
+    def _load(self, army):
+        self.keys[army] = sim_runner.store_keys(self.store, self.game_cls, self.pairs, self.data.units, self.data.cards,
+                                                self.use_heroes, self.kwargs(army), self.seed, self.mirror)
+        for o, key in enumerate(self.keys[army]):
+            covered = 0
+            for start, count, t in self.store.stored_batches(key, 0, 1 << 30):
+                if start != covered:
+                    break # Only a prefix of game indexes extends cleanly
+                sim_runner.merge_tally(self.cache[army][o], t)
+                self.cache[army][o]['cached'] += t['games']
+                covered = start + count
+
+    def evaluate(self, armies, n_games):
+        # Plays each army up to n_games game indexes per opponent
+        seats = 2 if self.mirror else 1
+        jobs, targets = [], []
+        for army in armies:
+            tallies = self.tallies(army)
+            spans = [(o, t['games'] // seats, n_games - t['games'] // seats) for o, t in enumerate(tallies)
+                     if t['games'] // seats < n_games]
+            for job in sim_runner.chunk_jobs(self.game_cls, self.pairs, spans, self.seed, self.use_heroes, self.workers,
+                                             self.kwargs(army), mirror=self.mirror):
+                # Results come back by job index: one flat tally per job
+                jobs.append((len(targets),) + job[1:])
+                targets.append((army, job[0]))
+        results = [sim_runner.empty_tally() for _ in jobs]
+
+        def on_done(job, t):
+            army, o = targets[job[0]]
+            if self.store:
+                self.store.add_batch(self.keys[army][o], job[4], job[5], t)
+        sim_runner.play_jobs(self.pool, jobs, results, on_done)
+        for (army, o), t in zip(targets, results):
+            sim_runner.merge_tally(self.cache[army][o], t)
+            self.played += t['games']
+
+    def score(self, army):
+        # (score over every opponent, games); draws count as half a win
+        total = sim_runner.empty_tally()
+        for t in self.tallies(army):
+            sim_runner.merge_tally(total, t)
+        return sim_runner.pair_score(total), total['games']
+
+def successive_halving(evaluator, armies, first_games=4, eta=3, max_games=64, keep=1):
+    # Survivors of the last round, best first, as (army, score, games); rounds as (candidates, games)
+    survivors = list(armies)
+    n_games = first_games
+    rounds = []
+    while True:
+        evaluator.evaluate(survivors, n_games)
+        rounds.append((len(survivors), n_games))
+        # Stable sort: ties keep the enumeration order
+        survivors.sort(key=lambda a: -evaluator.score(a)[0])
+        if len(survivors) <= keep or n_games >= max_games:
+            break
+        survivors = survivors[:max(keep, math.ceil(len(survivors) / eta))]
+        n_games = min(max_games, n_games * eta)
+    return [(a, *evaluator.score(a)) for a in survivors], rounds
+
+def army_label(army, names):
+    return ", ".join(f"{n}x {names.get(unit_id, unit_id)}" for unit_id, n in army)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faction", required=True, help="Faction whose army is built")
+    parser.add_argument("--scenario", default=None, help="scenarios.json id giving the budget and exclusions (e.g. s1)")
+    parser.add_argument("--budget", type=int, default=None, help="Gold per side (overrides the scenario)")
+    parser.add_argument("--exclude", action="append", default=None, help="Unit type not allowed (overrides the scenario)")
+    parser.add_argument("--max-copies", type=int, default=DEFAULT_MAX_COPIES, help="Copies of one unit at most")
+    parser.add_argument("--opponents", default=None, help="Comma separated faction codes (default: every other faction)")
+    parser.add_argument("--engine", choices=list(sim_sweep.ENGINES), default="simulation")
+    parser.add_argument("--games", type=int, default=4, help="Games per opponent in the first round")
+    parser.add_argument("--max-games", type=int, default=108, help="Games per opponent in the last round")
+    parser.add_argument("--eta", type=int, default=3, help="Each round keeps 1/ETA of the armies, with ETA times the games")
+    parser.add_argument("--top", type=int, default=5, help="Armies to report")
+    parser.add_argument("--heroes", action="store_true", help="The faction's hero can be bought")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mirror", action="store_true", help="Also play every game with seats swapped on the same dice")
+    parser.add_argument("--store", default=None, help="SQLite results store, shared with the simulators")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args()
+
+    data = sim_data.load(args.data_dir)
+    if args.faction not in data.factions_by_code:
+        parser.error(f"Unknown faction: {args.faction}")
+    budget, excluded = None, set()
+    if args.scenario:
+        scenario = next((s for s in load_scenarios(args.data_dir) if s['id'] == args.scenario), None)
+        if scenario is None:
+            parser.error(f"Unknown scenario: {args.scenario}")
+        try:
+            budget, excluded = scenario_rules(scenario)
+        except ValueError as e:
+            parser.error(str(e))
+    budget = args.budget if args.budget is not None else budget
+    excluded = {t.lower() for t in args.exclude} if args.exclude else excluded
+    if budget is None:
+        parser.error("Give a --scenario with a gold budget or a --budget")
+
+    game_cls = sim_sweep.ENGINES[args.engine]
+    pool = unit_pool(data.units, args.faction, game_cls.unit_cls, excluded, args.heroes)
+    armies = legal_armies(pool, budget, args.max_copies)
+    if not armies:
+        parser.error(f"No legal army for {args.faction} with {budget} gold")
+    if args.opponents:
+        opponents = [data.factions_by_code[code] for code in args.opponents.split(",")]
+    else:
+        opponents = [f for f in data.factions
+                     if f['code'] not in sim_sweep.EXCLUDED_FACTIONS and f['code'] != args.faction]
+    print(f"# Ejército de {args.faction}: {budget} oro" + (f", sin {', '.join(sorted(excluded))}" if excluded else "")
+          + f" | Candidatos: {len(armies)} | Rivales: {', '.join(f['code'] for f in opponents)} | Semilla: {args.seed}")
+
+    store = sim_store.ResultsStore(args.store) if args.store else None
+    with sim_runner.worker_pool(data.units, data.cards, args.workers, data.path) as executor:
+        evaluator = ArmyEvaluator(game_cls, data.factions_by_code[args.faction], opponents, data,
+                                  executor, args.seed, args.heroes, args.workers, {}, store, args.mirror)
+        best, rounds = successive_halving(evaluator, armies, args.games, args.eta, args.max_games, args.top)
+    if store:
+        store.close()
+
+    seats = 2 if args.mirror else 1
+    exhaustive = len(armies) * len(opponents) * args.max_games * seats
+    print("Rondas (ejércitos x partidas por rival): " + ", ".join(f"{n} x {g}" for n, g in rounds))
+    print(f"Partidas jugadas: {evaluator.played} (todas contra todos: {exhaustive})\n")
+    names = {u['id']: u['name']['es'] for u in data.units}
+    for rank, (army, score, games) in enumerate(best[:args.top], 1):
+        lo, hi = sim_runner.wilson_interval(score, games)
+        print(f"{rank}. {score:.1%} [{lo:.1%}, {hi:.1%}] (n={games}) | {army_cost(army, data.units)} oro | "
+              f"{army_label(army, names)}")
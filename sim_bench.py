@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+import sim_data
+import sim_profile
+import sim_runner
+import simulation
+import simulation_spatial
+
+# --- Benchmark Suite for both simulation engines ---
+# Fixed pairs and seeds, so two runs on the same machine play exactly the same
+# games. Results are written as JSON and can be compared against a baseline.
+# Phase times come from each engine's sim_profile hooks (inclusive times).
+# Throughput is timed in process CPU time, after a warm-up pass, as the median
+# of several passes. Each pair of a pass is preceded by a fixed pure-Python
+# calibration workload; relative_cost is CPU seconds of the games per CPU
+# second of calibration.
+# Runs at different times are not comparable enough to gate on: this machine's
+# speed drifts by minutes, and identical code scored 0.87x-1.37x of a saved
+# baseline. --baseline (a results JSON) is only reported. The regression gate,
+# --baseline-tree, plays the same passes with a checkout of the baseline code
+# in a second process, interleaved with this tree's (ABBA order), and takes the
+# median of the back-to-back time ratios: both sides see the same drift.
+
+BENCH_PAIRS = [("amazons", "orcs"), ("dwarves", "elves"), ("undead", "daemons")]
+BENCH_SEED = 12345
+BENCH_REPEATS = 5
+CALIBRATION_STEPS = 50000
+AB_ROUNDS = 20
+# Measured noise floor: identical code against itself (A/A, 8 gates of 20 rounds
+# per engine) stayed within 0.97x-1.04x. A delay added to Game.run read
+# 0.91x-0.93x at ~8% and 0.78x-0.82x at ~20%. A 10% tolerance passes
+# unchanged code with room to spare and fails slowdowns from ~14% on.
+AB_TOLERANCE = 0.10
+
+ENGINES = {
+    'simulation': (simulation, 300),
+    'simulation_spatial': (simulation_spatial, 40),
+}
+
+def load_data(data_dir):
+    data = sim_data.load(data_dir)
+    return data.units, data.factions_by_code, data.cards
+
+def bench_games(module, n_games, units, factions, cards, pairs=BENCH_PAIRS):
+    # Yields one (pair, game index) per game, same order every run
+    for code1, code2 in pairs:
+        for i in range(n_games):
+            yield lambda c1=code1, c2=code2, i=i: module.Game(factions[c1], factions[c2], units, cards,
+                                                              rng=sim_runner.game_rng(BENCH_SEED, c1, c2, i))
+
+def percentile(values, q):
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[k]
+
+def calibrate(steps=CALIBRATION_STEPS):
+    # CPU seconds of a fixed dict/RNG workload: how fast the interpreter runs right now
+    rng = random.Random(0)
+    counts = {}
+    start = time.process_time()
+    for i in range(steps):
+        k = rng.randrange(1000)
+        counts[k] = counts.get(k, 0) + i % 7
+        if k < 50:
+            del counts[k]
+    return time.process_time() - start
+
+def timed_pass(module, n_games, units, factions, cards):
+    # (CPU seconds, calibration CPU seconds, per-game wall seconds) of every bench
+    # game, no instrumentation at all; a calibration run before each pair
+    times = []
+    elapsed = calibration = 0.0
+    for pair in BENCH_PAIRS:
+        calibration += calibrate()
+        start = time.process_time()
+        for make_game in bench_games(module, n_games, units, factions, cards, [pair]):
+            t = time.perf_counter()
+            make_game().run()
+            times.append(time.perf_counter() - t)
+        elapsed += time.process_time() - start
+    return elapsed, calibration, times
+
+def bench_engine(name, n_games, units, factions, cards, repeats=BENCH_REPEATS):
+    module = ENGINES[name][0]
+
+    # 1. Throughput: one warm-up pass (caches, templates, allocator), then the median of `repeats`
+    timed_pass(module, n_games, units, factions, cards)
+    passes = sorted((timed_pass(module, n_games, units, factions, cards) for _ in range(max(1, repeats))),
+                    key=lambda p: p[0] / p[1])
+    elapsed, calibration, times = passes[len(passes) // 2]
+
+    # 2. Phase pass: same games with the engine's sim_profile phase timers
+    profile = sim_profile.empty_profile()
+    hooks = [h for h in module.Game.profile_hooks() if h[0] == 'phase' and h[1] != 'game']
+    with sim_profile.installed(hooks, profile):
+        t = time.perf_counter()
+        for make_game in bench_games(module, n_games, units, factions, cards):
+            make_game().run()
+        phase_total = time.perf_counter() - t
+
+    # 3. Memory pass: peak traced allocation over one game per pair
+    tracemalloc.start()
+    for code1, code2 in BENCH_PAIRS:
+        module.Game(factions[code1], factions[code2], units, cards,
+                    rng=sim_runner.game_rng(BENCH_SEED, code1, code2, 0)).run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'games': len(times),
+        'repeats': max(1, repeats),
+        'games_per_sec': len(times) / elapsed,
+        'relative_cost': elapsed / calibration, # Reported against --baseline
+        'mean_ms': 1000 * sum(times) / len(times),
+        'p95_ms': 1000 * percentile(times, 0.95),
+        'phases': {label: total / phase_total for label, total in profile['phases'].items()},
+        'peak_kb': peak / 1024,
+    }
+
+def compare(results, baseline):
+    # Prints the throughput against a saved results JSON (not gated, see above)
+    for name, r in results['engines'].items():
+        base = baseline.get('engines', {}).get(name)
+        if not base: continue
+        if 'relative_cost' in base:
+            ratio = base['relative_cost'] / r['relative_cost']
+            print(f"{name}: {r['games_per_sec']:.0f} vs baseline {base['games_per_sec']:.0f} games/s, "
+                  f"{ratio:.2f}x calibrated")
+        else: # Baseline from before calibration: raw throughput
+            ratio = r['games_per_sec'] / base['games_per_sec']
+            print(f"{name}: {r['games_per_sec']:.0f} vs baseline {base['games_per_sec']:.0f} games/s ({ratio:.2f}x)")
+
+# --- A/B Gate ---
+# One long-lived process per tree, importing that tree's engine. Each line on
+# its stdin plays one timed pass of the bench games and answers its CPU seconds.
+
+PASS_WORKER = """
+import sys, time, importlib
+tree, engine, n_games, data_dir, seed = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4], int(sys.argv[5])
+sys.path.insert(0, tree)
+import sim_data, sim_runner
+module = importlib.import_module(engine)
+data = sim_data.load(data_dir)
+pairs = [tuple(p.split(",")) for p in sys.argv[6:]]
+def timed_pass():
+    start = time.process_time()
+    for code1, code2 in pairs:
+        for i in range(n_games):
+            module.Game(data.factions_by_code[code1], data.factions_by_code[code2], data.units, data.cards,
+                        rng=sim_runner.game_rng(seed, code1, code2, i)).run()
+    return time.process_time() - start
+timed_pass() # Warm-up
+for _ in sys.stdin:
+    print(timed_pass(), flush=True)
+"""
+
+def start_pass_worker(tree, name, n_games, data_dir):
+    # tree: source checkout holding the engine, sim_data and sim_runner
+    tree = os.path.abspath(tree)
+    args = [sys.executable, "-c", PASS_WORKER, tree, name, str(n_games), data_dir, str(BENCH_SEED)]
+    return subprocess.Popen(args + [f"{c1},{c2}" for c1, c2 in BENCH_PAIRS], cwd=tree, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+def worker_pass(worker):
+    worker.stdin.write("\n")
+    worker.stdin.flush()
+    line = worker.stdout.readline()
+    if not line:
+        raise RuntimeError("Benchmark worker exited (see its error above)")
+    return float(line)
+
+def ab_ratio(name, n_games, baseline_tree, data_dir=None, rounds=AB_ROUNDS):
+    # Median of baseline time / this tree's time over back-to-back passes (> 1 = faster)
+    data_dir = os.path.abspath(data_dir or sim_data.DEFAULT_DATA_DIR) # Same JSON for both trees
+    here = os.path.dirname(os.path.abspath(__file__))
+    workers = [start_pass_worker(baseline_tree, name, n_games, data_dir), start_pass_worker(here, name, n_games, data_dir)]
+    ratios = []
+    try:
+        for r in range(rounds):
+            if r % 2: # ABBA: neither side always runs second
+                new, base = worker_pass(workers[1]), worker_pass(workers[0])
+            else:
+                base, new = worker_pass(workers[0]), worker_pass(workers[1])
+            ratios.append(base / new)
+    finally:
+        for w in workers:
+            w.stdin.close()
+            w.wait()
+    return statistics.median(ratios)
+
+def ab_gate(engines, baseline_tree, scale=1.0, data_dir=None, rounds=AB_ROUNDS, tolerance=AB_TOLERANCE):
+    # Returns a list of regression messages (empty = OK)
+    problems = []
+    for name in engines:
+        n_games = max(1, int(ENGINES[name][1] * scale))
+        ratio = ab_ratio(name, n_games, baseline_tree, data_dir, rounds)
+        print(f"{name}: {ratio:.3f}x of {baseline_tree} (median of {rounds} interleaved passes)")
+        if ratio < 1 - tolerance:
+            problems.append(f"{name} throughput regressed to {ratio:.2f}x of baseline")
+    return problems
+
+def print_results(results):
+    for name, r in results['engines'].items():
+        print(f"## {name}")
+        print(f"- Partidas: {r['games']} | {r['games_per_sec']:.0f} partidas/s")
+        print(f"- Media: {r['mean_ms']:.2f} ms | p95: {r['p95_ms']:.2f} ms | Pico memoria: {r['peak_kb']:.0f} KB")
+        print("- Fases: " + ", ".join(f"{k} {v * 100:.0f}%" for k, v in r['phases'].items()))
+        print("")
+
+def run_bench(engines, scale=1.0, data_dir=None, repeats=BENCH_REPEATS):
+    units, factions, cards = load_data(data_dir)
+    results = {
+        'python': platform.python_version(),
+        'pairs': BENCH_PAIRS,
+        'seed': BENCH_SEED,
+        'engines': {},
+    }
+    for name in engines:
+        n_games = max(1, int(ENGINES[name][1] * scale))
+        results['engines'][name] = bench_engine(name, n_games, units, factions, cards, repeats)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=list(ENGINES), action="append", help="Engine to bench (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier on the games per pair")
+    parser.add_argument("--repeats", type=int, default=BENCH_REPEATS, help="Timed passes per engine (the median counts)")
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Report the throughput against this results JSON (not gated)")
+    parser.add_argument("--baseline-tree", default=None,
+                        help="Gate: checkout of the baseline code (e.g. a git worktree), timed interleaved with this one")
+    parser.add_argument("--rounds", type=int, default=AB_ROUNDS, help="Interleaved pass pairs of the --baseline-tree gate")
+    parser.add_argument("--tolerance", type=float, default=AB_TOLERANCE, help="Allowed throughput drop vs --baseline-tree")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args()
+
+    results = run_bench(args.engine or list(ENGINES), args.scale, args.data_dir, args.repeats)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+    if args.baseline_tree:
+        problems = ab_gate(args.engine or list(ENGINES), args.baseline_tree, args.scale, args.data_dir, args.rounds,
+                           args.tolerance)
+        for p in problems:
+            print(f"REGRESION: {p}")
+        if problems:
+            sys.exit(1)
@@ -0,0 +1,346 @@
+import re
+import hashlib
+
+import sim_dice
+
+# --- Command Cards (shared by simulation.py and simulation_spatial.py) ---
+# cards.json is compiled once into CardTemplates: every effect option becomes a
+# few small closures (how many units it would activate, which ones, extra
+# draws, mana, spells), so a turn only calls functions and never reads text.
+# The English effect text is parsed; an effect that is not understood is a
+# data error. Tactic bonuses (charge, move-attack-move, +1 defense die) are not
+# modelled, only the activations they grant.
+#
+# The engines supply a Roster per turn: the player's units that are worth
+# activating by section (in priority order), all of them, and an adjacency
+# function. Spells call back into the game (spell_damage / spell_heal).
+
+CARD_MODES = ["deck", "abstract"]
+HAND_SIZE = 5 # Not fixed by the rules; the usual Command & Colors hand
+MAX_MANA = 5
+
+SECTION_SYMBOLS = {"🡄": "left", "🡅": "center", "🡆": "right"}
+SECTION_ORDER = ("left", "center", "right")
+TYPE_SYMBOLS = {"●": "light", "▼": "medium", "■": "heavy", "★": "elite"}
+ALL_UNITS = 99 # "Activate all ..."
+
+# AI weights of the non-activation parts of an option (1 activated unit = 1)
+DRAW_VALUE = 0.25
+MANA_VALUE = 0.5
+DAMAGE_DIE_VALUE = 0.5
+
+class Roster:
+    # One player's units as seen by the cards during one turn
+    __slots__ = ('by_section', 'units', 'type_counts', 'adjacent')
+
+    def __init__(self, by_section, units, type_counts, adjacent):
+        self.by_section = by_section # section -> units, best first
+        self.units = units # all activatable units, best first
+        self.type_counts = type_counts # type code -> len(units) of that type
+        self.adjacent = adjacent # unit -> allied units next to it
+
+    def of_types(self, codes):
+        return [u for u in self.units if u.type_code in codes]
+
+    def profile(self, mana):
+        # Everything a plain card option's value depends on (see CardTemplate.memo)
+        bs = self.by_section
+        tc = self.type_counts
+        return (len(bs["left"]), len(bs["center"]), len(bs["right"]), tc[0], tc[1], tc[2], tc[3], mana)
+
+# --- Selectors: (count, select, most units) over a Roster ---
+# count takes (roster, mana) so that a plain activation count is directly the
+# option's value function, one call per evaluation.
+
+def _section(section, n):
+    return (lambda r, mana=0: min(n, len(r.by_section[section])),
+            lambda r: r.by_section[section][:n], n)
+
+def _any(n):
+    return (lambda r, mana=0: min(n, len(r.units)),
+            lambda r: r.units[:n], n)
+
+def _each(n):
+    left, center, right = SECTION_ORDER
+    def count(r, mana=0):
+        bs = r.by_section
+        return min(n, len(bs[left])) + min(n, len(bs[center])) + min(n, len(bs[right]))
+    return (count, lambda r: [u for s in SECTION_ORDER for u in r.by_section[s][:n]], n * len(SECTION_ORDER))
+
+def _single(n):
+    left, center, right = SECTION_ORDER
+    def count(r, mana=0):
+        bs = r.by_section
+        return min(n, max(len(bs[left]), len(bs[center]), len(bs[right])))
+    def best(r):
+        return max(SECTION_ORDER, key=lambda s: len(r.by_section[s]))
+    return (count, lambda r: r.by_section[best(r)][:n], n)
+
+def _types(codes, n):
+    return (lambda r, mana=0: min(n, sum([r.type_counts[c] for c in codes])),
+            lambda r: r.of_types(codes)[:n], n)
+
+def _leader(codes):
+    def leader(r):
+        return next((u for u in r.units if u.type_code in codes), None)
+    def count(r, mana=0):
+        if not sum([r.type_counts[c] for c in codes]):
+            return 0
+        return 1 + len(r.adjacent(leader(r)))
+    def select(r):
+        u = leader(r)
+        return [u] + r.adjacent(u) if u else []
+    return (count, select, ALL_UNITS)
+
+def _count(token):
+    return ALL_UNITS if token == "all" else int(token)
+
+def _type_codes(symbols):
+    return tuple(sorted({sim_dice.TYPE_CODE[TYPE_SYMBOLS[s]] for s in symbols if s in TYPE_SYMBOLS}))
+
+# Clause patterns of the English effect text -> selector, in match order
+_SYM = "[🡄🡅🡆]"
+_TYPES = "[●▼■★](?: or [●▼■★])*"
+# Leader selections depend on positions, not just on the Roster.profile counts
+SELECTOR_PATTERNS = [
+    (re.compile(r"Activate (\d+) units? in any section"), lambda m: _any(int(m[1]))),
+    (re.compile(r"Activate (\d+) units? in each section.*"), lambda m: _each(int(m[1]))),
+    (re.compile(r"Activate (\d+) units? in a single section"), lambda m: _single(int(m[1]))),
+    (re.compile(rf"Activate (\d+) units? in ({_SYM}) and (\d+) in ({_SYM})"),
+     lambda m: (_section(SECTION_SYMBOLS[m[2]], int(m[1])), _section(SECTION_SYMBOLS[m[4]], int(m[3])))),
+    (re.compile(rf"Activate (\d+) units? in (?:the \w+ )?({_SYM})"),
+     lambda m: _section(SECTION_SYMBOLS[m[2]], int(m[1]))),
+    (re.compile(rf"Activate 1 ({_TYPES}) unit and all adjacent allied units"), lambda m: _leader(_type_codes(m[1]))),
+    (re.compile(rf"Activate (\d+|all) ({_TYPES}) units?"), lambda m: _types(_type_codes(m[2]), _count(m[1]))),
+    (re.compile(rf"Activate (\d+|all) units? ({_TYPES})"), lambda m: _types(_type_codes(m[2]), _count(m[1]))),
+]
+LEADER_PATTERN = SELECTOR_PATTERNS[5][0]
+DRAW_PATTERN = re.compile(r"Draw (\d+), discard (\d+)")
+MANA_PATTERN = re.compile(r"Gain (\d+) 💧 Mana.*")
+SPELL_PATTERNS = [
+    (re.compile(r"\((💧+)\) AoE damage F(\d+)"), 'damage'),
+    (re.compile(r"\((💧+)\) Restore (\d+) Strength.*"), 'heal'),
+]
+# Understood but not modelled: the option is never worth playing
+UNMODELLED_PATTERNS = [
+    re.compile(r"\((💧+)\) Move 1 unit to any free hex"),
+    re.compile(r"\((💧+)\) Unit ignores all damage.*"),
+    re.compile(r"Gain Charge bonus|Move 2 and attack|Move-Attack-Move|\+1 defense die.*"),
+]
+
+class CardOption:
+    __slots__ = ('text', 'count', 'select', 'value', 'bound', 'draw', 'discard', 'mana_gain', 'mana_cost',
+                 'spell', 'amount', 'playable', 'pure', 'special')
+
+    def __init__(self, text):
+        self.text = text
+        self.count = None # (roster, mana) -> number of units activated
+        self.select = None # roster -> units to activate
+        self.value = None # (roster, mana) -> AI value, -1 if it cannot be played
+        self.bound = 0 # highest value it can ever have
+        self.draw = 0
+        self.discard = 0
+        self.mana_gain = 0
+        self.mana_cost = 0
+        self.spell = None # 'damage' / 'heal'
+        self.amount = 0
+        self.playable = True
+        self.pure = True # value only depends on Roster.profile
+        self.special = False # has mana or a spell, beyond activations and draws
+
+def _compile_value(option, units_bound):
+    # Specialised closure per option: plain activations (most cards) cost one call
+    count = option.count or (lambda r, mana=0: 0)
+    extra = DRAW_VALUE * option.draw
+    option.bound = units_bound + extra + MANA_VALUE * option.mana_gain
+    if not option.playable:
+        option.bound = -1.0
+        return lambda r, mana: -1.0
+    if not (option.mana_cost or option.mana_gain or option.spell):
+        if extra:
+            return lambda r, mana: count(r) + extra
+        return count
+
+    cost, gain, spell, amount = option.mana_cost, option.mana_gain, option.spell, option.amount
+    if spell == 'damage':
+        option.bound += DAMAGE_DIE_VALUE * amount
+    elif spell == 'heal':
+        option.bound += amount
+
+    def value(r, mana):
+        if mana < cost:
+            return -1.0
+        v = count(r) + extra + MANA_VALUE * min(gain, MAX_MANA - mana)
+        if spell == 'damage':
+            v += DAMAGE_DIE_VALUE * amount
+        elif spell == 'heal':
+            v += min(amount, max((u.max_strength - u.current_strength for u in r.units), default=0))
+        return v
+    return value
+
+def compile_option(card_id, text):
+    option = CardOption(text)
+    selectors = []
+    for clause in (c.strip() for c in re.split(r"\.(?:\s+|$)", text)):
+        if not clause: continue
+        m = None
+        for pattern, build in SELECTOR_PATTERNS:
+            m = pattern.fullmatch(clause)
+            if m:
+                option.pure = option.pure and pattern is not LEADER_PATTERN
+                built = build(m)
+                selectors.extend(built if isinstance(built[0], tuple) else [built])
+                break
+        if m: continue
+        draw = DRAW_PATTERN.fullmatch(clause)
+        mana = MANA_PATTERN.fullmatch(clause)
+        if draw:
+            option.draw, option.discard = int(draw[1]), int(draw[2])
+        elif mana:
+            option.mana_gain = int(mana[1])
+        elif any(p.fullmatch(clause) for p in UNMODELLED_PATTERNS):
+            if clause.startswith("("):
+                option.playable = False
+        else:
+            for pattern, spell in SPELL_PATTERNS:
+                m = pattern.fullmatch(clause)
+                if m:
+                    option.spell, option.mana_cost, option.amount = spell, len(m[1]), int(m[2])
+                    option.pure = option.pure and spell != 'heal' # depends on wounds
+                    break
+            if not m:
+                raise ValueError(f"cards.json: {card_id} effect not understood: '{clause}'")
+
+    option.select = _no_units
+    if len(selectors) == 1:
+        option.count, option.select, _ = selectors[0]
+    elif selectors:
+        counts = [c for c, _, _ in selectors]
+        selects = [s for _, s, _ in selectors]
+        option.count = lambda r, mana=0: sum(c(r) for c in counts)
+        option.select = lambda r: [u for s in selects for u in s(r)]
+    option.value = _compile_value(option, sum(b for _, _, b in selectors))
+    option.special = bool(option.mana_gain or option.mana_cost or option.spell)
+    return option
+
+def _no_units(roster):
+    return []
+
+class CardTemplate:
+    __slots__ = ('id', 'type', 'options', 'bound', 'rank', 'memo')
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.type = data['type']
+        self.options = (compile_option(self.id, data['effectA']['en']), compile_option(self.id, data['effectB']['en']))
+        self.bound = max(o.bound for o in self.options)
+        # To pick discards without evaluating: the bound, with open-ended activations counted as 4 units
+        self.rank = max(o.bound if o.bound < ALL_UNITS else 4 for o in self.options)
+        # Roster.profile -> (value, option) of its better option, shared by every game
+        self.memo = {} if all(o.pure for o in self.options) else None
+
+    def best_option(self, roster, mana):
+        # A wins ties
+        a, b = self.options
+        va = a.value(roster, mana)
+        vb = b.value(roster, mana)
+        return (vb, b) if vb > va else (va, a)
+
+class DeckTemplate:
+    # Every physical card (count copies), compiled once per cards data
+    def __init__(self, cards_data):
+        self.cards = []
+        for c in cards_data:
+            template = CardTemplate(c)
+            self.cards.extend([template] * c.get('count', 1))
+
+    def fingerprint(self):
+        # Hash of what the engine plays (ids, copies and effect text), for the results store
+        state = [(c.id, c.type, [o.text for o in c.options]) for c in self.cards]
+        return hashlib.sha256(repr(state).encode('utf-8')).hexdigest()[:16]
+
+_deck_templates = {}
+
+def get_deck_template(cards_data):
+    # Same caching rule as the army templates: keyed on the cards_data object
+    key = id(cards_data)
+    entry = _deck_templates.get(key)
+    if entry is None or entry[0] is not cards_data:
+        entry = (cards_data, DeckTemplate(cards_data))
+        _deck_templates[key] = entry
+    return entry[1]
+
+class Deck:
+    # Draw pile + discard pile as plain lists. draw() takes a random card and
+    # fills the hole with the last one, so the pile never needs shuffling, and
+    # reshuffling the discards is just swapping the two lists.
+    __slots__ = ('rng', 'pile', 'discards')
+
+    def __init__(self, template, rng):
+        self.rng = rng
+        self.pile = list(template.cards)
+        self.discards = []
+
+    def draw(self):
+        pile = self.pile
+        if not pile:
+            if not self.discards:
+                return None
+            self.pile, self.discards = self.discards, pile
+            pile = self.pile
+        i = int(self.rng.random() * len(pile))
+        card = pile[i]
+        last = pile.pop()
+        if i < len(pile):
+            pile[i] = last
+        return card
+
+    def state(self):
+        # Copies of both piles, for Game.fork
+        return list(self.pile), list(self.discards)
+
+    def restore(self, state):
+        self.pile, self.discards = list(state[0]), list(state[1])
+
+    def draw_into(self, hand, n=1):
+        for _ in range(n):
+            card = self.draw()
+            if card is not None:
+                hand.append(card)
+        return hand
+
+def choose(hand, roster, mana):
+    # (hand index, option) with the highest value; first card wins ties.
+    # Most cards only look up their memo with the roster's profile; cards that
+    # cannot beat the best value so far are skipped.
+    key = None
+    best_i, best_option, best_value = 0, None, -2.0
+    for i, card in enumerate(hand):
+        if card.bound <= best_value: continue
+        memo = card.memo
+        if memo is None:
+            v, option = card.best_option(roster, mana)
+        else:
+            if key is None:
+                key = roster.profile(mana)
+            hit = memo.get(key)
+            if hit is None:
+                hit = memo[key] = card.best_option(roster, mana)
+            v, option = hit
+        if v > best_value:
+            best_i, best_option, best_value = i, option, v
+    return best_i, best_option
+
+def refill(deck, hand, played, option, hand_size=HAND_SIZE):
+    # Discard the played card, draw 1 (+ the option's extra draws), then
+    # discard the option's cards and anything over the hand size, lowest rank first
+    deck.discards.append(played)
+    card = deck.draw()
+    if card is not None:
+        hand.append(card)
+    if option.draw:
+        deck.draw_into(hand, option.draw)
+    excess = min(len(hand), max(option.discard, len(hand) - hand_size))
+    for _ in range(excess):
+        worst = min(range(len(hand)), key=lambda i: hand[i].rank)
+        deck.discards.append(hand.pop(worst))
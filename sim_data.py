@@ -0,0 +1,150 @@
+import os
+import json
+import mmap
+import pickle
+import hashlib
+import tempfile
+import argparse
+
+import sim_cards
+import sim_map
+
+# --- Game Data Loading (shared by simulation.py and simulation_spatial.py) ---
+# The JSON files are validated once and their parsed contents pickled into a
+# snapshot next to them. Later runs (and every worker process) load the
+# snapshot through mmap, so the pages are shared by the OS; it is rebuilt when
+# any source file changes. Army templates are not in it: each process compiles
+# them on first use (simulation.get_army_template), keyed on the loaded data.
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SOURCES = ("units.json", "factions.json", "cards.json", "terrain.json")
+SNAPSHOT_NAME = ".sim_snapshot.pickle"
+SNAPSHOT_VERSION = 2
+NO_COST = "Ø" # units.json marks units that cannot be bought this way
+
+class GameData:
+    def __init__(self, units, factions, cards, terrain, sources, path=None):
+        self.units = units
+        self.factions = factions
+        self.cards = cards
+        self.terrain = terrain
+        self.sources = sources # file name -> sha256 of its bytes
+        self.path = path # snapshot file, when loaded from / saved to one
+        self.factions_by_code = {f['code']: f for f in factions}
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def source_hashes(data_dir):
+    hashes = {}
+    for name in SOURCES:
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+def validate(units, factions, cards, terrain):
+    # Returns a list of problems (empty = valid)
+    problems = []
+    codes = {f.get('code') for f in factions}
+    for f in factions:
+        if 'code' not in f or 'es' not in f.get('name', {}):
+            problems.append(f"factions.json: faction without code/name.es: {f}")
+    seen = set()
+    for u in units:
+        uid = u.get('id', '?')
+        for key in ('id', 'faction', 'type', 'expansion'):
+            if key not in u:
+                problems.append(f"units.json: {uid} has no '{key}'")
+        if 'es' not in u.get('name', {}):
+            problems.append(f"units.json: {uid} has no name.es")
+        if uid in seen:
+            problems.append(f"units.json: duplicate id {uid}")
+        seen.add(uid)
+        if u.get('faction') not in codes:
+            problems.append(f"units.json: {uid} has unknown faction '{u.get('faction')}'")
+        for key in ('strength', 'movement', 'range', 'cost'):
+            if key in u and not isinstance(u[key], int) and not (key == 'cost' and u[key] == NO_COST):
+                problems.append(f"units.json: {uid}.{key} is not an integer")
+    for c in cards:
+        if 'id' not in c or 'type' not in c:
+            problems.append(f"cards.json: card without id/type: {c.get('id', '?')}")
+        if not isinstance(c.get('count', 1), int) or c.get('count', 1) < 0:
+            problems.append(f"cards.json: {c.get('id', '?')} has an invalid count")
+        try:
+            sim_cards.CardTemplate(c) # Effects the card engine can play
+        except (KeyError, ValueError) as e:
+            problems.append(str(e) if isinstance(e, ValueError) else f"cards.json: {c.get('id', '?')} has no {e}")
+    for t in terrain:
+        try:
+            sim_map.TerrainRule(t) # Effects the spatial engine can play
+        except (KeyError, ValueError) as e:
+            problems.append(str(e) if isinstance(e, ValueError) else f"terrain.json: {t.get('id', '?')} has no {e}")
+    return problems
+
+def load_units_variant(path, data):
+    # A second units.json (A/B comparisons), checked against the loaded data's factions
+    units = load_json(path)
+    problems = validate(units, data.factions, [], [])
+    if problems:
+        raise ValueError(f"Invalid units variant {path}:\n" + "\n".join(problems))
+    return units
+
+def compile_snapshot(data_dir):
+    units = load_json(os.path.join(data_dir, "units.json"))
+    factions = load_json(os.path.join(data_dir, "factions.json"))
+    cards = load_json(os.path.join(data_dir, "cards.json"))
+    terrain = load_json(os.path.join(data_dir, "terrain.json"))
+    problems = validate(units, factions, cards, terrain)
+    if problems:
+        raise ValueError("Invalid game data:\n" + "\n".join(problems))
+
+    path = os.path.join(data_dir, SNAPSHOT_NAME)
+    data = GameData(units, factions, cards, terrain, source_hashes(data_dir))
+    payload = {'version': SNAPSHOT_VERSION, 'sources': data.sources,
+               'units': units, 'factions': factions, 'cards': cards, 'terrain': terrain}
+    # A temp file of its own per run (two runs may compile at once), then an
+    # atomic rename, so concurrent readers never see half a file
+    try:
+        fd, tmp = tempfile.mkstemp(dir=data_dir, prefix=SNAPSHOT_NAME, suffix=".tmp")
+    except OSError:
+        return data # Read-only data folder: in-memory data, workers get a pickled copy
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return data
+    data.path = path
+    return data
+
+def read_snapshot(path):
+    # GameData, or None if the snapshot is from another SNAPSHOT_VERSION
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            payload = pickle.loads(mm)
+    if payload.get('version') != SNAPSHOT_VERSION:
+        return None
+    return GameData(payload['units'], payload['factions'], payload['cards'], payload['terrain'], payload['sources'], path)
+
+def load(data_dir=None):
+    # Snapshot if it is current, otherwise validate the JSON and rebuild it
+    data_dir = data_dir or DEFAULT_DATA_DIR
+    path = os.path.join(data_dir, SNAPSHOT_NAME)
+    if os.path.exists(path):
+        try:
+            data = read_snapshot(path)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            data = None
+        if data and data.sources == source_hashes(data_dir):
+            return data
+    return compile_snapshot(data_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+    data = compile_snapshot(args.data_dir)
+    print(f"Snapshot: {data.path or 'not written (read-only data folder)'} | {len(data.units)} units, {len(data.factions)} factions, {len(data.cards)} cards, {len(data.terrain)} terrains")
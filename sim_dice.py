@@ -0,0 +1,234 @@
+import math
+import random
+import argparse
+from bisect import bisect_right
+from collections import Counter
+from functools import lru_cache
+
+# --- Batched Dice Engine (shared by simulation.py and simulation_spatial.py) ---
+# Faces are small ints: 0 sword, 1 flag, 2 circle,
+# 3 triangle, 4 square, 5 magic. Faces are drawn in bulk into a bytes buffer
+# and attacks consume slices of it, so a whole attack is one translate + count.
+
+FACE_SWORD = 0
+FACE_FLAG = 1
+FACE_CIRCLE = 2
+FACE_TRIANGLE = 3
+FACE_SQUARE = 4
+FACE_MAGIC = 5
+FACE_CODES = range(6)
+
+# Faces that hit each defender type (keyed by UnitType value)
+HIT_FACES = {
+    'light': (FACE_SWORD, FACE_CIRCLE, FACE_MAGIC),
+    'medium': (FACE_SWORD, FACE_TRIANGLE),
+    'heavy': (FACE_SWORD, FACE_SQUARE),
+    'elite': (FACE_SWORD,),
+}
+
+def _hit_table(faces):
+    table = bytearray(256)
+    for f in faces:
+        table[f] = 1
+    return bytes(table)
+
+# bytes.translate tables: hit faces -> 1, everything else -> 0
+HIT_MASK = {t: _hit_table(faces) for t, faces in HIT_FACES.items()}
+
+# Integer type codes used by the simulators' Units (index into UNIT_TYPES)
+UNIT_TYPES = ('light', 'medium', 'heavy', 'elite')
+TYPE_CODE = {t: i for i, t in enumerate(UNIT_TYPES)}
+HIT_MASK_BY_CODE = tuple(HIT_MASK[t] for t in UNIT_TYPES)
+
+BUFFER_SIZE = 512
+
+# --- Exact Outcome Tables ---
+# Per die: hit with p = len(hit faces)/6, flag with p = 1/6, otherwise blank.
+# The joint (hits, flags) distribution of n dice is built by convolution.
+
+DICE_MODES = ["roll", "table"]
+MAX_TABLE_DICE = 6 # Strength tops at 5 in units.json; larger counts are built on demand
+
+@lru_cache(maxsize=None)
+def outcome_table(dice, defender_type):
+    p_hit = len(HIT_FACES[defender_type]) / 6
+    p_flag = 1 / 6
+    p_blank = 1 - p_hit - p_flag
+    dist = {(0, 0): 1.0}
+    for _ in range(dice):
+        nxt = {}
+        for (h, f), p in dist.items():
+            nxt[(h + 1, f)] = nxt.get((h + 1, f), 0.0) + p * p_hit
+            nxt[(h, f + 1)] = nxt.get((h, f + 1), 0.0) + p * p_flag
+            nxt[(h, f)] = nxt.get((h, f), 0.0) + p * p_blank
+        dist = nxt
+    return dist
+
+@lru_cache(maxsize=None)
+def cumulative_table(dice, defender_type):
+    # (outcomes, cumulative probabilities) for sampling with a single rng.random()
+    outcomes = sorted(outcome_table(dice, defender_type))
+    cum = []
+    total = 0.0
+    for o in outcomes:
+        total += outcome_table(dice, defender_type)[o]
+        cum.append(total)
+    cum[-1] = 1.0
+    return outcomes, cum
+
+def hits_distribution(dice, defender_type):
+    # Marginal P(hits = h), h = 0..dice
+    probs = [0.0] * (dice + 1)
+    for (h, _), p in outcome_table(dice, defender_type).items():
+        probs[h] += p
+    return probs
+
+def expected_hits(dice, defender_type):
+    return dice * len(HIT_FACES[defender_type]) / 6
+
+for _t in HIT_FACES:
+    for _n in range(MAX_TABLE_DICE + 1):
+        cumulative_table(_n, _t)
+
+# --- Distribution Propagation: exact 1v1 duel odds ---
+# Units trade melee attacks (dice = current strength) until one is destroyed.
+# Solved exactly over (attacker strength, defender strength) states, no sampling.
+
+@lru_cache(maxsize=None)
+def duel_win_probability(a_strength, a_type, d_strength, d_type):
+    # P(attacker wins) with the attacker striking first
+    if d_strength <= 0: return 1.0
+    if a_strength <= 0: return 0.0
+    pa = hits_distribution(a_strength, d_type)
+    pd = hits_distribution(d_strength, a_type)
+    # Attacker's swing into a defender-to-move state, and vice versa
+    xa = sum(p * _defender_turn(a_strength, a_type, d_strength - h, d_type) for h, p in enumerate(pa) if h > 0)
+    xd = sum(p * duel_win_probability(a_strength - h, a_type, d_strength, d_type) for h, p in enumerate(pd) if h > 0)
+    qa, qd = pa[0], pd[0]
+    # A = qa*D + xa, D = qd*A + xd  (both sides miss -> back to the same state)
+    return (qa * xd + xa) / (1 - qa * qd)
+
+def _defender_turn(a_strength, a_type, d_strength, d_type):
+    # P(attacker wins) when the defender strikes next
+    return 1.0 - duel_win_probability(d_strength, d_type, a_strength, a_type)
+
+class DiceEngine:
+    def __init__(self, rng, buffer_size=BUFFER_SIZE, mode="roll"):
+        self.rng = rng
+        self.buffer_size = buffer_size
+        self.mode = mode
+        self._buf = b""
+        self._pos = 0
+        if mode == "table":
+            self.hits_flags = self._table_hits_flags
+
+    def state(self):
+        # Buffered faces and read position (bytes: a fork shares them, no copy)
+        return self._buf, self._pos
+
+    def restore(self, state):
+        self._buf, self._pos = state
+
+    def reseed(self, rng):
+        # Draw from rng from now on; faces buffered from the old one are dropped
+        self.rng = rng
+        self._buf = b""
+        self._pos = 0
+
+    def faces(self, count):
+        if self._pos + count > len(self._buf):
+            # Keep the unread tail so no drawn face is ever discarded
+            need = max(self.buffer_size, count)
+            self._buf = self._buf[self._pos:] + bytes(self.rng.choices(FACE_CODES, k=need))
+            self._pos = 0
+        start = self._pos
+        self._pos += count
+        return self._buf[start:self._pos]
+
+    def hits_flags(self, count, type_code):
+        rolls = self.faces(count)
+        # Flags never hit any type, so every flag face counts as a flag
+        return rolls.translate(HIT_MASK_BY_CODE[type_code]).count(1), rolls.count(FACE_FLAG)
+
+    def _table_hits_flags(self, count, type_code):
+        # One rng call per attack, sampled from the exact outcome table
+        outcomes, cum = cumulative_table(count, UNIT_TYPES[type_code])
+        return outcomes[bisect_right(cum, self.rng.random())]
+
+# --- Statistical equivalence check against the per-die reference ---
+
+def reference_hit(face, defender_type):
+    # The original per-die rule (Unit.can_be_hit_by), written out instead of read
+    # from HIT_FACES, so a wrong table or mask shows up as a difference
+    if face == FACE_SWORD: return True
+    if defender_type == 'light' and face in (FACE_CIRCLE, FACE_MAGIC): return True
+    if defender_type == 'medium' and face == FACE_TRIANGLE: return True
+    if defender_type == 'heavy' and face == FACE_SQUARE: return True
+    return False
+
+def reference_hits_flags(rng, count, defender_type):
+    # One die at a time: faces that hit the defender type count as hits, flags that miss as flags
+    hits = flags = 0
+    for _ in range(count):
+        face = rng.choice(FACE_CODES)
+        if reference_hit(face, defender_type): hits += 1
+        elif face == FACE_FLAG: flags += 1
+    return hits, flags
+
+def chi2_two_sample(a, b):
+    # Two-sample chi-square over the union of outcomes; returns (stat, dof)
+    na, nb = sum(a.values()), sum(b.values())
+    keys = set(a) | set(b)
+    stat = 0.0
+    for k in keys:
+        oa, ob = a.get(k, 0), b.get(k, 0)
+        tot = oa + ob
+        ea, eb = tot * na / (na + nb), tot * nb / (na + nb)
+        stat += (oa - ea) ** 2 / ea + (ob - eb) ** 2 / eb
+    return stat, max(1, len(keys) - 1)
+
+def chi2_pvalue(stat, dof):
+    # Wilson-Hilferty normal approximation of the chi-square upper tail
+    z = ((stat / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def check_equivalence(samples=20000, seed=1, alpha=0.001, mode="roll"):
+    rng_ref = random.Random(seed)
+    engine = DiceEngine(random.Random(seed + 1), mode=mode)
+    ok = True
+    for defender_type in UNIT_TYPES:
+        for count in range(1, 6):
+            ref = Counter(reference_hits_flags(rng_ref, count, defender_type) for _ in range(samples))
+            new = Counter(engine.hits_flags(count, TYPE_CODE[defender_type]) for _ in range(samples))
+            stat, dof = chi2_two_sample(ref, new)
+            p = chi2_pvalue(stat, dof)
+            status = "OK" if p >= alpha else "FAIL"
+            ok = ok and p >= alpha
+            print(f"{defender_type:>6} x{count}: chi2={stat:7.2f} dof={dof:2d} p={p:.4f} {status}")
+    return ok
+
+def print_tables(max_strength=5):
+    types = list(HIT_FACES)
+    print("## Impactos esperados (dados x tipo defensor)")
+    print("dados | " + " | ".join(types))
+    for n in range(1, max_strength + 1):
+        print(f"{n:5d} | " + " | ".join(f"{expected_hits(n, t):.2f}" for t in types))
+
+    print("\n## Duelo 1v1: P(victoria del atacante), ataca primero")
+    cols = [(t, s) for t in types for s in range(1, max_strength + 1)]
+    print("atacante \\ defensor | " + " | ".join(f"{t[0]}{s}" for t, s in cols))
+    for at, a_s in cols:
+        row = [f"{duel_win_probability(a_s, at, d_s, dt):.2f}" for dt, d_s in cols]
+        print(f"{at:>6} {a_s} | " + " | ".join(row))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=20000, help="Attacks sampled per (dice, type) cell")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=DICE_MODES, default="roll", help="Engine mode checked against the reference")
+    parser.add_argument("--tables", action="store_true", help="Print exact expected-hit and duel tables and exit")
+    args = parser.parse_args()
+    if args.tables:
+        print_tables()
+        raise SystemExit(0)
+    raise SystemExit(0 if check_equivalence(args.samples, args.seed, mode=args.mode) else 1)
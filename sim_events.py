@@ -0,0 +1,78 @@
+import os
+import json
+
+# --- Event Stream (shared by simulation.py and simulation_spatial.py) ---
+# Games push plain tuples to an optional sink; with no sink the hot path pays a
+# single "if self.events" check and builds nothing.
+#
+#   (EV_START, game_index, p1_code, p2_code)
+#   (EV_HIT,   turn, player, attacker_id, target_id, hits, flags)
+#   (EV_KILL,  turn, player, target_id)
+#   (EV_MOVE,  turn, player, unit_id, from, to)   from/to: section name or (col, row)
+#   (EV_CARD,  turn, player, card_id, option)      option: "A" or "B"
+#   (EV_END,   turn, winner)
+
+EV_START = "start"
+EV_HIT = "hit"
+EV_KILL = "kill"
+EV_MOVE = "move"
+EV_CARD = "card"
+EV_END = "end"
+
+class PrintSink:
+    # Human readable, replaces the old verbose debug game. names: Game.unit_info()
+    def __init__(self, names=None):
+        self.names = names or {}
+
+    def _name(self, unit_id):
+        info = self.names.get(unit_id)
+        return info['name_es'] if info else unit_id
+
+    def emit(self, ev):
+        kind = ev[0]
+        if kind == EV_START:
+            print(f"--- Debug Game #{ev[1]}: {ev[2]} vs {ev[3]} ---")
+        elif kind == EV_HIT:
+            print(f"[T{ev[1]}] P{ev[2]} {self._name(ev[3])} hits {self._name(ev[4])} for {ev[5]} dmg")
+        elif kind == EV_KILL:
+            print(f"[T{ev[1]}] {self._name(ev[3])} eliminated!")
+        elif kind == EV_MOVE:
+            print(f"[T{ev[1]}] P{ev[2]} {self._name(ev[3])} moves {ev[4]} -> {ev[5]}")
+        elif kind == EV_CARD:
+            print(f"[T{ev[1]}] P{ev[2]} plays {ev[3]} ({ev[4]})")
+        elif kind == EV_END:
+            print(f"--- End (turn {ev[1]}): {ev[2]} ---")
+
+    def close(self):
+        pass
+
+class JsonlSink:
+    # One JSON array per line, written as the game runs (nothing kept in memory).
+    # Each (pair, chunk) file is written once per run: a rerun into the same
+    # trace directory replaces it instead of appending a second copy
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8')
+
+    def emit(self, ev):
+        self.f.write(json.dumps(ev, separators=(',', ':')))
+        self.f.write("\n")
+
+    def close(self):
+        self.f.close()
+
+class TeeSink:
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def emit(self, ev):
+        for s in self.sinks:
+            s.emit(ev)
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
+
+def trace_path(trace_dir, code1, code2, start):
+    # One file per (pair, chunk) so parallel workers never share a file
+    os.makedirs(trace_dir, exist_ok=True)
+    return os.path.join(trace_dir, f"{code1}-{code2}-{start:06d}.jsonl")
@@ -0,0 +1,327 @@
+import re
+import hashlib
+from urllib.parse import urlsplit, parse_qs
+
+# --- Battle Maps (used by simulation_spatial.py) ---
+# Maps use the MapEditorView encoding "sizeCode|terrain": one character per hex,
+# row-major (col = i % cols, row = i // cols). A map is compiled once into a
+# Board: flat per-hex tables for movement, dice modifiers and line of sight,
+# shared by every game played on it. terrain.json is parsed like cards.json:
+# an effect text that is not understood is a data error.
+
+TERRAIN_MAP = {'t1': 'a', 't2': 'b', 't3': 'c', 't4': 'd', 't5': 'e', 't6': 'f', 't7': 'g'} # As in MapEditorView
+TERRAIN_IDS = {ch: tid for tid, ch in TERRAIN_MAP.items()}
+DEFAULT_TERRAIN = 't1' # Unknown or missing characters, as in the editor
+MAP_SIZES = {'s': (13, 9), 'e': (26, 9), 'k': (9, 7), 'l': (15, 11)} # size code -> (cols, rows)
+DEFAULT_SIZE = 's'
+
+# --- Hex Geometry (odd-r: odd rows are shoved right, as drawn by the editor) ---
+
+def offset_to_cube(col, row):
+    x = col - (row - (row & 1)) // 2
+    z = row
+    y = -x - z
+    return (x, y, z)
+
+def cube_to_offset(x, z):
+    return (x + (z - (z & 1)) // 2, z)
+
+def cube_distance(a, b):
+    # a, b are (col, row) tuples
+    ac = offset_to_cube(*a)
+    bc = offset_to_cube(*b)
+    return max(abs(ac[0] - bc[0]), abs(ac[1] - bc[1]), abs(ac[2] - bc[2]))
+
+EVEN_OFFSETS = [(1,0), (0,-1), (-1,-1), (-1,0), (-1,1), (0,1)]
+ODD_OFFSETS = [(1,0), (1,-1), (0,-1), (-1,0), (0,1), (1,1)]
+
+def cube_round(x, y, z):
+    rx, ry, rz = round(x), round(y), round(z)
+    dx, dy, dz = abs(rx - x), abs(ry - y), abs(rz - z)
+    if dx > dy and dx > dz:
+        rx = -ry - rz
+    elif dy > dz:
+        ry = -rx - rz
+    else:
+        rz = -rx - ry
+    return rx, ry, rz
+
+def hex_line(a, b, nudge=1e-6):
+    # Hexes strictly between a and b. The line is nudged off hex corners; the
+    # sign of the nudge picks the side when it runs along an edge.
+    n = cube_distance(a, b)
+    ax, ay, az = offset_to_cube(*a)
+    bx, by, bz = offset_to_cube(*b)
+    ax, ay, az = ax + nudge, ay + nudge, az - 2 * nudge
+    line = []
+    for i in range(1, n):
+        t = i / n
+        x, _, z = cube_round(ax + (bx - ax) * t, ay + (by - ay) * t, az + (bz - az) * t)
+        line.append(cube_to_offset(x, z))
+    return line
+
+_geometry = {}
+
+def get_geometry(cols, rows):
+    # (hexes, neighbours, distances) of an empty board, shared by every map of that size
+    entry = _geometry.get((cols, rows))
+    if entry is None:
+        hexes = [(c, r) for r in range(rows) for c in range(cols)]
+        neighbors = {}
+        for col, row in hexes:
+            offsets = ODD_OFFSETS if row & 1 else EVEN_OFFSETS
+            neighbors[(col, row)] = tuple((col + dx, row + dy) for dx, dy in offsets
+                                          if 0 <= col + dx < cols and 0 <= row + dy < rows)
+        distances = {a: {b: cube_distance(a, b) for b in hexes} for a in hexes}
+        entry = _geometry[(cols, rows)] = (hexes, neighbors, distances)
+    return entry
+
+# --- Terrain Rules ---
+
+class TerrainRule:
+    # What one terrain type does, from its terrain.json effect texts
+    __slots__ = ('id', 'cost', 'stops', 'defense', 'attack_from', 'uphill', 'high_ground', 'mana',
+                 'flag_immune', 'blocks_los')
+
+    def __init__(self, data=None):
+        self.id = data['id'] if data else DEFAULT_TERRAIN
+        self.cost = 1 # Movement points to enter; None = impassable
+        self.stops = False # Entering ends the move
+        self.defense = 0 # Dice modifier to attacks against units on it
+        self.attack_from = 0 # Dice modifier to attacks made from it
+        self.uphill = 0 # Dice modifier to attackers standing on other terrain
+        self.high_ground = False # Ranged attacks from it ignore the distance penalty
+        self.mana = 0 # Extra mana per turn for the player holding it
+        self.flag_immune = False # Flags are not modelled by the spatial engine yet
+        self.blocks_los = False
+        if data:
+            _parse(self, data, 'effectMovement', MOVEMENT_PATTERNS)
+            _parse(self, data, 'effectCombat', COMBAT_PATTERNS)
+            _parse(self, data, 'effectVision', VISION_PATTERNS)
+
+    def is_plain(self):
+        return (self.cost == 1 and not self.stops and not self.defense and not self.attack_from
+                and not self.uphill and not self.high_ground and not self.mana and not self.blocks_los)
+
+def _set(**fields):
+    def apply(rule, m):
+        for k, v in fields.items():
+            setattr(rule, k, v(m) if callable(v) else v)
+    return apply
+
+_NONE = r"(?:No effect|No penalty|Open terrain)\."
+_DICE = r"([+-]\d+) di(?:e|ce)"
+
+MOVEMENT_PATTERNS = [
+    (re.compile(_NONE), _set()),
+    (re.compile(r"Units must stop(?: when entering)?\."), _set(stops=True)),
+    # The editor has no bridges, so rivers are never crossed
+    (re.compile(r"Impassable(?: except at bridges)?\."), _set(cost=None)),
+]
+COMBAT_PATTERNS = [
+    (re.compile(_NONE), _set()),
+    (re.compile(_DICE + r" to incoming attacks\."), _set(defense=lambda m: int(m.group(1)))),
+    (re.compile(r"Attacks from \w+ have " + _DICE + r"\."), _set(attack_from=lambda m: int(m.group(1)))),
+    (re.compile(r"Attacker from below rolls " + _DICE + r"\."), _set(uphill=lambda m: int(m.group(1)))),
+    (re.compile(r"Range Advantage: .*ignore the first -1 distance penalty.*\."), _set(high_ground=True)),
+    (re.compile(r"Grants \+(\d+) Mana.* if controlled\."), _set(mana=lambda m: int(m.group(1)))),
+    (re.compile(r"Immune to the first flag\."), _set(flag_immune=True)),
+]
+VISION_PATTERNS = [
+    (re.compile(_NONE), _set()),
+    (re.compile(r"Blocks line of sight\."), _set(blocks_los=True)),
+]
+
+def _parse(rule, data, field, patterns):
+    # Every sentence of the English text must be understood
+    text = data[field]['en']
+    rest = text
+    for pattern, apply in patterns:
+        m = pattern.search(rest)
+        if m:
+            apply(rule, m)
+            rest = rest[:m.start()] + rest[m.end():]
+    if rest.strip(" ."):
+        raise ValueError(f"terrain.json: {rule.id} {field} not understood: '{text}'")
+
+class TerrainRules:
+    # Compiled terrain.json: id -> TerrainRule
+    def __init__(self, terrain_data):
+        self.rules = {t['id']: TerrainRule(t) for t in terrain_data}
+        if DEFAULT_TERRAIN not in self.rules:
+            self.rules[DEFAULT_TERRAIN] = TerrainRule()
+        # Hash of the compiled rules, for board caching and the results store
+        state = sorted((r.id, [getattr(r, k) for k in TerrainRule.__slots__[1:]]) for r in self.rules.values())
+        self.fingerprint = hashlib.sha256(repr(state).encode('utf-8')).hexdigest()[:16]
+
+_terrain_rules = {}
+
+def get_terrain_rules(terrain_data):
+    # Same caching rule as the army and deck templates: keyed on the terrain_data object
+    key = id(terrain_data)
+    entry = _terrain_rules.get(key)
+    if entry is None or entry[0] is not terrain_data:
+        entry = (terrain_data, TerrainRules(terrain_data))
+        _terrain_rules[key] = entry
+    return entry[1]
+
+# --- Map Decoding ---
+
+def decode_map(map_code):
+    # "s|aabc..." (or an editor permalink with ?m=...) -> (cols, rows, flat terrain ids)
+    if '?' in map_code:
+        parts = urlsplit(map_code)
+        query = parse_qs(parts.fragment.partition('?')[2] or parts.query)
+        if 'm' not in query:
+            raise ValueError(f"No map (m=...) in permalink: {map_code}")
+        map_code = query['m'][0]
+    size_code, sep, encoded = map_code.partition('|')
+    if not sep:
+        raise ValueError(f"Invalid map '{map_code}': expected sizeCode|terrain")
+    cols, rows = MAP_SIZES.get(size_code, MAP_SIZES[DEFAULT_SIZE])
+    terrain = [TERRAIN_IDS.get(ch, DEFAULT_TERRAIN) for ch in encoded[:cols * rows]]
+    terrain += [DEFAULT_TERRAIN] * (cols * rows - len(terrain))
+    return cols, rows, terrain
+
+# --- Line of Sight ---
+# Bit i of a mask is hex i of the board (row-major, as in the map string), so
+# "which of these hexes can I see" is one AND. Sight depends only on where the
+# blocking hexes are: maps with the same blocking layout share a SightTable.
+
+class SightTable:
+    def __init__(self, cols, rows, blocking):
+        self.hexes = get_geometry(cols, rows)[0]
+        self.blocking = blocking # frozenset of blocking hexes
+        self.full = (1 << len(self.hexes)) - 1
+        self._masks = {} # origin -> mask of hexes in sight, filled on demand
+
+    def mask(self, origin):
+        # Blocking hexes themselves can be seen. A line running along a hex edge
+        # is only blocked if both sides block; off-board hexes never block.
+        seen = self._masks.get(origin)
+        if seen is None:
+            if not self.blocking:
+                seen = self.full
+            else:
+                blocking = self.blocking
+                seen = 0
+                for i, pos in enumerate(self.hexes):
+                    if (not any(h in blocking for h in hex_line(origin, pos)) or
+                            not any(h in blocking for h in hex_line(origin, pos, -1e-6))):
+                        seen |= 1 << i
+            self._masks[origin] = seen
+        return seen
+
+_sight_tables = {}
+
+def get_sight_table(cols, rows, blocking):
+    key = (cols, rows, blocking)
+    table = _sight_tables.get(key)
+    if table is None:
+        table = _sight_tables[key] = SightTable(cols, rows, blocking)
+    return table
+
+# --- Boards ---
+
+class Board:
+    # A compiled map. Per-hex tables are keyed by (col, row) like unit positions;
+    # terrain is the flat row-major list of terrain ids.
+    def __init__(self, cols, rows, terrain=None, rules=None):
+        self.cols = cols
+        self.rows = rows
+        self.terrain = terrain or [DEFAULT_TERRAIN] * (cols * rows)
+        rules = rules or TerrainRules([])
+        self.hexes, self.neighbors, self.distances = get_geometry(cols, rows)
+
+        # Card sections per column, as each player sees them (player 2 faces player 1, so left and right swap)
+        third = cols // 3
+        columns = ["left" if c < third else "right" if c >= cols - third else "center" for c in range(cols)]
+        self.sections = {1: columns, 2: columns[::-1]}
+
+        self.cost = {}
+        self.stops = {}
+        self.defense = {}
+        self.attack_from = {}
+        self.uphill = {}
+        self.high_ground = {}
+        self.blocks_los = {}
+        self.altars = [] # (pos, mana) of hexes that give mana to their holder
+        for pos, tid in zip(self.hexes, self.terrain):
+            rule = rules.rules.get(tid)
+            if rule is None:
+                raise ValueError(f"Map uses terrain '{tid}', not in terrain.json")
+            self.cost[pos] = rule.cost
+            self.stops[pos] = rule.stops
+            self.defense[pos] = rule.defense
+            self.attack_from[pos] = rule.attack_from
+            self.uphill[pos] = rule.uphill
+            self.high_ground[pos] = rule.high_ground
+            self.blocks_los[pos] = rule.blocks_los
+            if rule.mana:
+                self.altars.append((pos, rule.mana))
+        # Nothing on the map changes play: the engine skips the terrain rules
+        self.plain = all(rules.rules[tid].is_plain() for tid in set(self.terrain))
+
+        # Bitsets: bits[pos] is the hex's bit, sight the shared line-of-sight table
+        self.index = {pos: i for i, pos in enumerate(self.hexes)}
+        self.bits = {pos: 1 << i for i, pos in enumerate(self.hexes)}
+        self.sight = get_sight_table(cols, rows, frozenset(p for p in self.hexes if self.blocks_los[p]))
+        self._fire = {} # origin -> fire masks by range, filled on demand
+        # Movement by hex index (sim_path): passable neighbours, stop flags
+        self.steps = [tuple(self.index[n] for n in self.neighbors[pos] if self.cost[n] is not None)
+                      for pos in self.hexes]
+        self.stop_flags = [self.stops[pos] for pos in self.hexes]
+
+    def dice_modifier(self, a, b):
+        # Terrain dice modifier for an attack from hex a on hex b
+        mod = self.defense[b] + self.attack_from[a]
+        if self.uphill[b] and not self.uphill[a]:
+            mod += self.uphill[b]
+        return mod
+
+    def fire_bands(self, origin):
+        # Range bands of origin: bands[r] = mask of the hexes a unit there can
+        # attack with range r (adjacent ones always, the rest in line of sight).
+        # The last band covers the whole board, for any longer range.
+        bands = self._fire.get(origin)
+        if bands is None:
+            dists = self.distances[origin]
+            rings = [0] * (max(dists.values()) + 1)
+            for pos, bit in self.bits.items():
+                rings[dists[pos]] |= bit
+            seen = self.sight.mask(origin)
+            bands = [0]
+            within = 0
+            for ring in rings[1:]:
+                within |= ring
+                bands.append((within & seen) | rings[1])
+            self._fire[origin] = bands
+        return bands
+
+    def fire_mask(self, origin, range_val):
+        bands = self._fire.get(origin) or self.fire_bands(origin)
+        return bands[range_val] if range_val < len(bands) else bands[-1]
+
+    def can_fire(self, a, b, range_val):
+        # Can a unit at a with range_val attack hex b
+        return self.fire_mask(a, range_val) & self.bits[b] != 0
+
+_boards = {}
+
+def get_board(map_code=None, terrain_data=None):
+    # One Board per (map, terrain rules); None is the empty standard map
+    if map_code is None:
+        key = None
+    else:
+        if terrain_data is None:
+            raise ValueError("A map needs terrain_data (terrain.json)")
+        rules = get_terrain_rules(terrain_data)
+        key = (map_code, rules.fingerprint)
+    board = _boards.get(key)
+    if board is None:
+        if map_code is None:
+            board = Board(*MAP_SIZES[DEFAULT_SIZE])
+        else:
+            board = Board(*decode_map(map_code), rules)
+        _boards[key] = board
+    return board
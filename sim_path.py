@@ -0,0 +1,63 @@
+# --- Pathfinding (used by simulation_spatial.py) ---
+# One multi-source BFS from every enemy hex gives each board hex its walking
+# distance to the nearest enemy (impassable terrain included; units are not
+# obstacles, since they move during the turn). The field is built once per
+# enemy layout and every unit walks down it, so a move costs O(movement)
+# whatever the army size. Hexes are sim_map.Board indices, sets are bitsets.
+
+UNREACHABLE = 1 << 30
+
+def distance_field(board, sources):
+    # sources: bitset of the hexes to walk to. Every step costs 1 (terrain only
+    # makes hexes impassable or ends the move there)
+    field = [UNREACHABLE] * len(board.hexes)
+    frontier = []
+    while sources:
+        low = sources & -sources
+        sources ^= low
+        i = low.bit_length() - 1
+        field[i] = 0
+        frontier.append(i)
+    steps = board.steps
+    d = 0
+    while frontier:
+        d += 1
+        nxt = []
+        for i in frontier:
+            for n in steps[i]:
+                if field[n] == UNREACHABLE:
+                    field[n] = d
+                    nxt.append(n)
+        frontier = nxt
+    return field
+
+def follow(board, field, start, movement, occupied):
+    # Hex where a unit at start ends after walking down the field. Each step
+    # takes the lowest empty neighbour; when units hold every lower one, it
+    # sidesteps along the same level (never back to a hex of this move).
+    # Entering a stop hex ends the move; next to an enemy it never moves.
+    steps, stops = board.steps, board.stop_flags
+    i = start
+    visited = 1 << start
+    left = movement
+    while left > 0:
+        here = field[i]
+        best = -1
+        best_d = here
+        side = -1
+        for n in steps[i]:
+            if (occupied | visited) >> n & 1: continue
+            d = field[n]
+            if d < best_d:
+                best = n
+                best_d = d
+            elif d == here and side < 0:
+                side = n
+        if best < 0:
+            if here <= 1 or side < 0: break
+            best = side
+        i = best
+        visited |= 1 << i
+        left -= 1
+        if stops[i]: break
+    return i
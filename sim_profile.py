@@ -0,0 +1,153 @@
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+
+# --- Profiling (shared by simulation.py and simulation_spatial.py) ---
+# Opt-in instrumentation with no cost when it is off: nothing in the engines
+# checks for it. While a chunk is profiled, the methods listed by the Game
+# class's profile_hooks() are swapped for counting / timing wrappers, and put
+# back afterwards. Profiles are plain dicts, merged across workers like tallies.
+#
+# Hook kinds: (kind, label, owner, method name[, position attribute])
+#   phase: wall time of the call into phases[label] (inclusive of nested phases)
+#   count: counters[label] += 1
+#   dice:  counters[label] += dice rolled (the method's first argument)
+#   move:  counters[label] += 1, and counters['blocked_' + label] when the
+#          unit's position attribute did not change
+
+COUNTERS = "counters" # Counters and phase times
+CPROFILE = "cprofile" # The same plus a cProfile of every game
+
+def empty_profile(mode=None):
+    # mode: what the runner collects into this profile (COUNTERS or CPROFILE)
+    return {'mode': mode, 'games': 0, 'counters': {}, 'phases': {}, 'pstats': None}
+
+def merge_profile(into, other):
+    into['games'] += other['games']
+    for part in ('counters', 'phases'):
+        for k, v in other[part].items():
+            into[part][k] = into[part].get(k, 0) + v
+    if other['pstats']:
+        if into['pstats'] is None:
+            into['pstats'] = pstats.Stats(_RawStats(other['pstats']))
+        else:
+            into['pstats'].add(_RawStats(other['pstats']))
+    return into
+
+class _RawStats:
+    # pstats.Stats loads any object with create_stats() and a .stats dict
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def _wrap(hook, fn, profile):
+    kind, label = hook[0], hook[1]
+    counters, phases = profile['counters'], profile['phases']
+    if kind == 'phase':
+        phases.setdefault(label, 0.0)
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                phases[label] += time.perf_counter() - t
+        return wrapper
+    counters.setdefault(label, 0)
+    if kind == 'count':
+        def wrapper(*args, **kwargs):
+            counters[label] += 1
+            return fn(*args, **kwargs)
+    elif kind == 'dice':
+        def wrapper(self, count, *args, **kwargs):
+            counters[label] += count
+            return fn(self, count, *args, **kwargs)
+    elif kind == 'move':
+        attr = hook[4]
+        blocked = 'blocked_' + label
+        counters.setdefault(blocked, 0)
+        def wrapper(self, unit, *args, **kwargs):
+            before = getattr(unit, attr)
+            result = fn(self, unit, *args, **kwargs)
+            counters[label] += 1
+            if getattr(unit, attr) == before:
+                counters[blocked] += 1
+            return result
+    else:
+        raise ValueError(f"Unknown profile hook kind: {kind}")
+    return wrapper
+
+@contextmanager
+def installed(hooks, profile):
+    # Wrap the hooked methods for the duration of the block
+    originals = []
+    try:
+        for hook in hooks:
+            owner, name = hook[2], hook[3]
+            fn = getattr(owner, name)
+            originals.append((owner, name, fn))
+            setattr(owner, name, _wrap(hook, fn, profile))
+        yield profile
+    finally:
+        for owner, name, fn in reversed(originals):
+            setattr(owner, name, fn)
+
+@contextmanager
+def profiling(game_cls, mode):
+    # Profile of the games played inside the block (caller sets 'games')
+    profile = empty_profile()
+    with installed(game_cls.profile_hooks(), profile):
+        if mode == CPROFILE:
+            pr = cProfile.Profile()
+            pr.enable()
+            try:
+                yield profile
+            finally:
+                pr.disable()
+                pr.create_stats()
+                profile['pstats'] = pr.stats
+        else:
+            yield profile
+
+def dump_pstats(profile, path):
+    # Merged cProfile of every profiled game, readable with pstats / snakeviz
+    if profile['pstats'] is not None:
+        profile['pstats'].dump_stats(path)
+
+# Report text per language (simulation.py reports in Spanish, simulation_spatial.py
+# in English); LABELS names the counters and phases of the Spanish report
+REPORT_TEXT = {
+    'en': {
+        'none': "No games profiled (all results came from the store)",
+        'games': "Games profiled: {}",
+        'counters': "Counters (total, per game): ",
+        'phases': "Phases (inclusive, ms per game, share of game time): ",
+    },
+    'es': {
+        'none': "Ninguna partida perfilada (todos los resultados vienen del almacén)",
+        'games': "Partidas perfiladas: {}",
+        'counters': "Contadores (total, por partida): ",
+        'phases': "Fases (inclusivas, ms por partida, parte del tiempo de partida): ",
+    },
+}
+LABELS = {
+    'es': {'game': 'partida', 'setup': 'preparación', 'cards': 'cartas', 'movement': 'movimiento',
+           'combat': 'combate', 'victory': 'victoria', 'attacks': 'ataques', 'dice': 'dados', 'moves': 'movimientos',
+           'blocked_moves': 'movimientos bloqueados'},
+}
+
+def report_lines(profile, lang="en"):
+    text, labels = REPORT_TEXT[lang], LABELS.get(lang, {})
+    games = profile['games']
+    if not games:
+        return [text['none']]
+    lines = [text['games'].format(games)]
+    lines.append(text['counters'] + ", ".join(
+        f"{labels.get(k, k)} {v} ({v / games:.1f})" for k, v in profile['counters'].items()))
+    phases = profile['phases']
+    total = phases.get('game') or sum(phases.values()) or 1.0
+    lines.append(text['phases'] + ", ".join(
+        f"{labels.get(k, k)} {1000 * v / games:.3f} ms ({v / total:.0%})" for k, v in phases.items()))
+    return lines
@@ -0,0 +1,131 @@
+import io
+import os
+import csv
+import json
+import time
+
+import sim_runner
+
+# --- Matchup Matrix Output (shared by simulation.py and simulation_spatial.py) ---
+# Full N x N matrix, each cell seen from the row faction: wins, draws, losses,
+# win and draw rates with Wilson intervals, and mean turns of its wins.
+# The files are rewritten (atomically) while the sweep runs, so a long run can
+# be watched live and other tools can read them at any moment.
+
+MATRIX_FORMATS = ('.csv', '.json', '.md')
+CSV_FIELDS = ('row', 'col', 'games', 'wins', 'draws', 'losses', 'win_rate', 'win_lo', 'win_hi',
+              'draw_rate', 'draw_lo', 'draw_hi', 'avg_win_turns')
+
+def matrix_cell(row, col, wins, draws, losses, win_turns, z=1.96):
+    games = wins + draws + losses
+    win_rate = wins / games if games else 0.0
+    draw_rate = draws / games if games else 0.0
+    win_lo, win_hi = sim_runner.wilson_interval(win_rate, games, z)
+    draw_lo, draw_hi = sim_runner.wilson_interval(draw_rate, games, z)
+    return {'row': row, 'col': col, 'games': games, 'wins': wins, 'draws': draws, 'losses': losses,
+            'win_rate': win_rate, 'win_lo': win_lo, 'win_hi': win_hi,
+            'draw_rate': draw_rate, 'draw_lo': draw_lo, 'draw_hi': draw_hi,
+            'avg_win_turns': win_turns / wins if wins else 0.0}
+
+def _write_atomic(path, text):
+    # Readers never see a half written file
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class MatrixWriter:
+    # pairs: (code1, code2) in the runner's pair order. update() is the runner's
+    # on_tally callback; files are rewritten at most every `interval` seconds.
+    def __init__(self, paths, pairs, meta=None, interval=1.0, z=1.96):
+        for path in paths:
+            if os.path.splitext(path)[1].lower() not in MATRIX_FORMATS:
+                raise ValueError(f"Unknown matrix format: {path} (use {', '.join(MATRIX_FORMATS)})")
+        self.paths = paths
+        self.pairs = pairs
+        self.meta = meta or {}
+        self.interval = interval
+        self.z = z
+        self.codes = []
+        for pair in pairs:
+            for code in pair:
+                if code not in self.codes:
+                    self.codes.append(code)
+        self.tallies = [sim_runner.empty_tally() for _ in pairs]
+        self.last_flush = 0.0
+
+    def update(self, p, tally):
+        self.tallies[p] = dict(tally)
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def cells(self):
+        # {row: {col: cell}} for every pair with games, both directions
+        grid = {code: {} for code in self.codes}
+        for (code1, code2), t in zip(self.pairs, self.tallies):
+            if not t['games']: continue
+            grid[code1][code2] = matrix_cell(code1, code2, t['wins1'], t['draws'], t['wins2'], t['turns1'], self.z)
+            grid[code2][code1] = matrix_cell(code2, code1, t['wins2'], t['draws'], t['wins1'], t['turns2'], self.z)
+        return grid
+
+    def flush(self, final=False):
+        grid = self.cells()
+        for path in self.paths:
+            ext = os.path.splitext(path)[1].lower()
+            if ext == '.csv':
+                _write_atomic(path, self.to_csv(grid))
+            elif ext == '.json':
+                _write_atomic(path, self.to_json(grid, final))
+            else:
+                _write_atomic(path, self.to_markdown(grid, final))
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush(final=True)
+
+    def progress(self):
+        # Pairs with at least one game, total games so far
+        done = sum(1 for t in self.tallies if t['games'])
+        return done, sum(t['games'] for t in self.tallies)
+
+    def to_csv(self, grid):
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(CSV_FIELDS)
+        for row in self.codes:
+            for col in self.codes:
+                c = grid[row].get(col)
+                if c:
+                    w.writerow([c[k] if isinstance(c[k], (int, str)) else f"{c[k]:.4f}" for k in CSV_FIELDS])
+        return buf.getvalue()
+
+    def to_json(self, grid, final=False):
+        done, games = self.progress()
+        doc = dict(self.meta, final=final, pairs_played=done, pairs=len(self.pairs), games=games,
+                   factions=self.codes, cells=grid)
+        return json.dumps(doc, indent=2)
+
+    def to_markdown(self, grid, final=False):
+        done, games = self.progress()
+        z_pct = "95%" if abs(self.z - 1.96) < 1e-9 else f"z={self.z}"
+        out = [f"# Matchup matrix ({'final' if final else 'in progress'})", ""]
+        out.append(" | ".join(f"{k}: {v}" for k, v in self.meta.items()) +
+                   f" | Pairs played: {done}/{len(self.pairs)} | Games: {games}")
+        out.append("")
+        out.append(f"Row faction win rate vs column [{z_pct} Wilson], draw rate, mean turns of its wins.")
+        out.append("")
+        out.append("| | " + " | ".join(self.codes) + " |")
+        out.append("|---" * (len(self.codes) + 1) + "|")
+        for row in self.codes:
+            cols = []
+            for col in self.codes:
+                c = grid[row].get(col)
+                if row == col:
+                    cols.append("-")
+                elif not c:
+                    cols.append("")
+                else:
+                    cols.append(f"{c['win_rate']:.0%} [{c['win_lo']:.0%}-{c['win_hi']:.0%}] "
+                                f"d{c['draw_rate']:.0%} t{c['avg_win_turns']:.1f}")
+            out.append(f"| {row} | " + " | ".join(cols) + " |")
+        return "\n".join(out) + "\n"
@@ -0,0 +1,441 @@
+import os
+import math
+import pickle
+import random
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import sim_cards
+import sim_data
+import sim_events
+import sim_map
+import sim_profile
+import sim_store
+
+# --- Matchup Runner (shared by simulation.py and simulation_spatial.py) ---
+# Work is split in (pair, game-chunk) units. Every game gets its own RNG seeded
+# from (seed, pair, game index), so the aggregate tallies are identical no matter
+# how many workers run or how the games are chunked.
+
+def new_seed():
+    return random.SystemRandom().randrange(2**32)
+
+def game_rng(seed, code1, code2, game_index):
+    # String seeds are hashed with SHA-512 by random.seed, stable across processes
+    return random.Random(f"{seed}:{code1}:{code2}:{game_index}")
+
+def empty_tally():
+    # cached: games read back from a results store instead of played
+    # seat_wins: wins of whoever moved first. units / unit_sum / unit_sq / game_sq:
+    # moments of faction 1's score (see Paired Sampling), for the games played here
+    return {'games': 0, 'wins1': 0, 'wins2': 0, 'draws': 0, 'turns1': 0, 'turns2': 0, 'cached': 0,
+            'seat_wins': 0, 'units': 0, 'unit_sum': 0.0, 'unit_sq': 0.0, 'game_sq': 0.0}
+
+def merge_tally(into, other):
+    # Stored batches only carry the base fields; 'variant' is a nested tally
+    for k, v in other.items():
+        if isinstance(v, dict):
+            merge_tally(into.setdefault(k, empty_tally()), v)
+        else:
+            into[k] = into.get(k, 0) + v
+    return into
+
+# Worker-side data, set once per process by the pool initializer
+_worker_data = {}
+
+def _init_worker(units, cards, snapshot=None, variant=None):
+    # With a snapshot path, workers mmap the compiled data instead of receiving a pickled copy.
+    # variant: second units.json for A/B comparisons (always pickled)
+    if snapshot:
+        try:
+            data = sim_data.read_snapshot(snapshot)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            data = None
+        if data is None:
+            # Replaced by another version (or unreadable): load the sources instead
+            data = sim_data.load(os.path.dirname(snapshot))
+        units, cards = data.units, data.cards
+    _worker_data['units'] = units
+    _worker_data['cards'] = cards
+    _worker_data['variant'] = variant
+
+def patched_units(units, patch):
+    # units.json with patch = ((unit id, field, value), ...) applied. Cached per
+    # process, so every chunk of a variant shares its army templates
+    if not patch:
+        return units
+    cache = _worker_data.setdefault('patched', {})
+    entry = cache.get((id(units), patch))
+    if entry is None or entry[0] is not units:
+        changes = {}
+        for unit_id, field, value in patch:
+            changes.setdefault(unit_id, {})[field] = value
+        if not set(changes) <= {u['id'] for u in units}:
+            raise ValueError(f"Unknown unit in patch: {sorted(set(changes) - {u['id'] for u in units})}")
+        patched = [dict(u, **changes[u['id']]) if u['id'] in changes else u for u in units]
+        entry = cache[(id(units), patch)] = (units, patched)
+    return entry[1]
+
+def play_chunk(game_cls, f1, f2, start, count, seed, use_heroes, game_kwargs, debug_first=False, trace_dir=None,
+               profile=None, mirror=False, compare=False, patch=()):
+    # profile: None, sim_profile.COUNTERS or sim_profile.CPROFILE; the chunk's
+    # profile travels back to the parent in tally['profile']. patch: see patched_units
+    args = (game_cls, f1, f2, start, count, seed, use_heroes, game_kwargs, debug_first, trace_dir, mirror, compare,
+            patch)
+    if profile:
+        with sim_profile.profiling(game_cls, profile) as prof:
+            tally = _play_games(*args)
+        prof['games'] = tally['games'] + tally.get('variant', {}).get('games', 0)
+        tally['profile'] = prof
+        return tally
+    return _play_games(*args)
+
+def _play_games(game_cls, f1, f2, start, count, seed, use_heroes, game_kwargs, debug_first, trace_dir, mirror, compare,
+                patch):
+    # Every game index is one sampling unit: a game, or with mirror the same game
+    # replayed with seats swapped on the same RNG. With compare, each unit is also
+    # played with the variant units.json (same RNGs: common random numbers).
+    code1, code2 = f1['code'], f2['code']
+    tally = empty_tally()
+    variants = [(patched_units(_worker_data['units'], patch), tally)]
+    if compare:
+        tally['variant'] = empty_tally()
+        tally['cross'] = 0.0
+        variants.append((_worker_data['variant'], tally['variant']))
+    seats = ((f1, f2), (f2, f1)) if mirror else ((f1, f2),)
+
+    unit_scores = []
+    for v, (units, t) in enumerate(variants):
+        scores = [0.0] * count
+        for s, (fa, fb) in enumerate(seats):
+            # Events (debug / trace) only for the main units
+            outcomes = _outcomes(game_cls, fa, fb, units, start, count, seed, code1, code2, use_heroes, game_kwargs,
+                                 debug_first and v == 0 and s == 0, trace_dir if v == 0 else None)
+            for j, (winner, turns) in enumerate(outcomes):
+                _count_game(t, winner, turns, code1, code2, fa['code'])
+                score = 1.0 if winner == code1 else 0.0 if winner == code2 else 0.5
+                t['game_sq'] += score * score
+                scores[j] += score / len(seats)
+        t['units'] += count
+        t['unit_sum'] += sum(scores)
+        t['unit_sq'] += sum(x * x for x in scores)
+        unit_scores.append(scores)
+    if compare:
+        tally['cross'] += sum(a * b for a, b in zip(*unit_scores))
+    return tally
+
+def _outcomes(game_cls, fa, fb, units, start, count, seed, code1, code2, use_heroes, game_kwargs, debug_first,
+              trace_dir):
+    # (winner, turns) of games start..start+count with fa moving first; the RNG
+    # stays keyed on the pair's own order, so both seats see the same stream
+    cards = _worker_data['cards']
+    trace = sim_events.JsonlSink(sim_events.trace_path(trace_dir, fa['code'], fb['code'], start)) if trace_dir else None
+    outcomes = []
+    for i in range(start, start + count):
+        g = game_cls(fa, fb, units, cards, use_heroes=use_heroes, rng=game_rng(seed, code1, code2, i), **game_kwargs)
+        g.events = trace
+        if debug_first and i == 0:
+            debug = sim_events.PrintSink(g.unit_info())
+            g.events = sim_events.TeeSink(debug, trace) if trace else debug
+        if g.events:
+            g.events.emit((sim_events.EV_START, i, fa['code'], fb['code']))
+        outcomes.append((g.run(), g.turn_count))
+    if trace:
+        trace.close()
+    return outcomes
+
+def _count_game(tally, winner, turns, code1, code2, first):
+    tally['games'] += 1
+    if winner == first:
+        tally['seat_wins'] += 1
+    if winner == code1:
+        tally['wins1'] += 1
+        tally['turns1'] += turns
+    elif winner == code2:
+        tally['wins2'] += 1
+        tally['turns2'] += turns
+    else:
+        tally['draws'] += 1
+
+def _play_chunk_packed(job):
+    return job[0], play_chunk(*job[1:])
+
+def chunk_jobs(game_cls, pairs, spans, seed, use_heroes, workers, game_kwargs, debug_first=False, trace_dir=None,
+               profile=None, mirror=False, compare=False, patch=()):
+    # spans: (pair index, first game index, game count). Aim for ~4 chunks per
+    # worker so the pool stays balanced at the end of a sweep.
+    total = sum(n for _, _, n in spans)
+    chunk = max(1, math.ceil(total / (workers * 4)))
+    jobs = []
+    for p, first, n in spans:
+        f1, f2 = pairs[p]
+        for start in range(first, first + n, chunk):
+            count = min(chunk, first + n - start)
+            jobs.append((p, game_cls, f1, f2, start, count, seed, use_heroes, game_kwargs, debug_first and p == 0, trace_dir,
+                         profile and profile['mode'], mirror, compare, patch))
+    return jobs
+
+@contextmanager
+def worker_pool(units, cards, workers, snapshot=None, variant=None):
+    # None means "play in this process". snapshot: sim_data snapshot file holding units/cards
+    if workers <= 1:
+        _init_worker(units, cards, variant=variant)
+        yield None
+        return
+    initargs = (None, None, snapshot, variant) if snapshot else (units, cards, None, variant)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        yield pool
+
+def play_jobs(pool, jobs, tallies, on_done=None, profile=None):
+    results = map(_play_chunk_packed, jobs) if pool is None else pool.map(_play_chunk_packed, jobs)
+    for job, (p, tally) in zip(jobs, results):
+        chunk_profile = tally.pop('profile', None)
+        if chunk_profile:
+            sim_profile.merge_profile(profile, chunk_profile)
+        merge_tally(tallies[p], tally)
+        if on_done:
+            on_done(job, tally)
+
+def store_keys(store, game_cls, pairs, units, cards, use_heroes, game_kwargs, seed, mirror=False):
+    engine = f"{game_cls.engine}@{game_cls.version}"
+    options = dict(game_kwargs or {})
+    if mirror:
+        # A stored game index then covers both seats
+        options['mirror'] = True
+    if options.get('card_mode', 'deck') == 'deck':
+        # Games play the command deck: editing cards.json must not reuse old results
+        options['deck'] = sim_cards.get_deck_template(cards).fingerprint()
+    if options.get('terrain_data') is not None:
+        # Same for terrain.json on a map (the map string itself is part of the options)
+        options['terrain_data'] = sim_map.get_terrain_rules(options['terrain_data']).fingerprint
+    armies = (game_kwargs or {}).get('armies') or {}
+    fingerprints = {}
+    for f1, f2 in pairs:
+        for f in (f1, f2):
+            if f['code'] not in fingerprints:
+                fingerprints[f['code']] = game_cls.army_fingerprint(f['code'], units, use_heroes, armies.get(f['code']))
+    return [store.pair_key(engine, f1['code'], f2['code'], fingerprints[f1['code']], fingerprints[f2['code']],
+                           use_heroes, options, seed) for f1, f2 in pairs]
+
+def play_spans(pool, spans, tallies, job_args, store=None, keys=None, report_only=False, on_tally=None):
+    # Plays (pair, first game, count) spans. With a store, batches already stored
+    # are read back instead of played, and every new chunk is appended to it.
+    # on_tally(pair index, tally) is called whenever a pair's tally grows.
+    todo = []
+    for p, first, n in spans:
+        gaps = [(first, n)]
+        if store:
+            batches = store.stored_batches(keys[p], first, first + n)
+            for _, _, t in batches:
+                merge_tally(tallies[p], t)
+                tallies[p]['cached'] += t['games']
+            if batches and on_tally:
+                on_tally(p, tallies[p])
+            gaps = sim_store.missing_spans(batches, first, first + n)
+        if not report_only:
+            todo.extend((p, start, count) for start, count in gaps)
+
+    jobs = chunk_jobs(spans=todo, **job_args)
+    def on_done(job, t):
+        if store:
+            store.add_batch(keys[job[0]], job[4], job[5], t)
+        if on_tally:
+            on_tally(job[0], tallies[job[0]])
+    play_jobs(pool, jobs, tallies, on_done, job_args.get('profile'))
+
+def _setup(game_cls, pairs, units, cards, use_heroes, seed, workers, debug_first, game_kwargs, trace_dir, store,
+           profile, mirror, variant):
+    # Store keys and chunk_jobs arguments shared by run_matchups and run_adaptive
+    if store and variant is not None:
+        raise ValueError("A/B comparisons cannot use a results store (it only keys one units.json)")
+    keys = store_keys(store, game_cls, pairs, units, cards, use_heroes, game_kwargs, seed, mirror) if store else None
+    job_args = dict(game_cls=game_cls, pairs=pairs, seed=seed, use_heroes=use_heroes, workers=max(1, workers),
+                    game_kwargs=game_kwargs or {}, debug_first=debug_first, trace_dir=trace_dir, profile=profile,
+                    mirror=mirror, compare=variant is not None)
+    return keys, job_args
+
+def run_matchups(game_cls, pairs, n_games, units, cards, use_heroes=False, seed=None, workers=1,
+                 debug_first=False, game_kwargs=None, trace_dir=None, store=None, report_only=False, snapshot=None,
+                 on_tally=None, profile=None, mirror=False, variant=None):
+    # Returns one tally per pair, in the same order as pairs.
+    # game_kwargs are extra Game options (e.g. dice_mode), passed to every game.
+    # debug_first prints the first game's events; trace_dir streams every game to JSONL files.
+    # store (sim_store.ResultsStore) skips batches already played; report_only plays nothing.
+    # snapshot: sim_data snapshot of units/cards for the workers to load.
+    # on_tally(pair index, tally) reports progress as chunks finish (e.g. sim_report.MatrixWriter.update).
+    # profile: sim_profile.empty_profile(mode), filled with the profile of every game played.
+    # mirror / variant: paired sampling (see below); n_games then counts game indexes.
+    if seed is None:
+        seed = new_seed()
+    tallies = [empty_tally() for _ in pairs]
+    keys, job_args = _setup(game_cls, pairs, units, cards, use_heroes, seed, workers, debug_first, game_kwargs,
+                            trace_dir, store, profile, mirror, variant)
+    spans = [(p, 0, n_games) for p in range(len(pairs))]
+
+    with worker_pool(units, cards, workers, snapshot, variant) as pool:
+        play_spans(pool, spans, tallies, job_args, store, keys, report_only, on_tally)
+    return tallies
+
+# --- Adaptive Estimation ---
+# The score of a pair is faction 1's win rate, draws counting as half a win.
+# Pairs are played in batches until the Wilson interval of the score is within
+# +-precision; the budget left by settled pairs goes to the widest intervals.
+
+def pair_score(tally):
+    n = tally['games']
+    return (tally['wins1'] + 0.5 * tally['draws']) / n if n else 0.5
+
+def wilson_interval(p, n, z=1.96):
+    if n == 0:
+        return 0.0, 1.0
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+def half_width(tally, z=1.96):
+    # Mirrored pairs vary less than two single games: once enough of them were
+    # played, their own variance gives the interval instead of the Wilson one
+    stats = unit_stats(tally)
+    if stats and stats[2] > 1 and tally['units'] >= MIN_UNITS:
+        return z * math.sqrt(stats[1] / (tally['games'] / stats[2]))
+    lo, hi = wilson_interval(pair_score(tally), tally['games'], z)
+    return (hi - lo) / 2
+
+def run_adaptive(game_cls, pairs, budget, units, cards, use_heroes=False, seed=None, workers=1,
+                 precision=0.02, z=1.96, batch=50, debug_first=False, game_kwargs=None, trace_dir=None,
+                 store=None, report_only=False, snapshot=None, on_tally=None, profile=None, mirror=False, variant=None):
+    # Same tallies as run_matchups, with a variable number of games per pair.
+    # Each round only depends on the merged tallies, so it stays reproducible.
+    # budget counts games: a mirrored game index costs two.
+    if seed is None:
+        seed = new_seed()
+    tallies = [empty_tally() for _ in pairs]
+    # debug_first only fires on game 0 of the first pair, i.e. in the first round
+    keys, job_args = _setup(game_cls, pairs, units, cards, use_heroes, seed, workers, debug_first, game_kwargs,
+                            trace_dir, store, profile, mirror, variant)
+    seats = 2 if mirror else 1
+    used = 0
+
+    with worker_pool(units, cards, workers, snapshot, variant) as pool:
+        while used < budget:
+            # Widest intervals first (stable sort keeps pair order on ties)
+            open_pairs = [p for p in range(len(pairs)) if half_width(tallies[p], z) > precision]
+            open_pairs.sort(key=lambda p: -half_width(tallies[p], z))
+            if not open_pairs:
+                break
+            spans = []
+            # Never more than a fair share, so a small budget still reaches every pair.
+            # Counted in game indexes (seats games each), rounded up
+            left = (budget - used) // seats
+            share = max(1, -(-left // len(open_pairs)))
+            for p in open_pairs:
+                n = min(max(1, batch // seats), share, (budget - used) // seats)
+                if n <= 0: break
+                spans.append((p, tallies[p]['games'] // seats, n))
+                used += n * seats
+            if not spans:
+                break # Less than one game index of budget left
+            play_spans(pool, spans, tallies, job_args, store, keys, report_only, on_tally)
+    return tallies
+
+# --- Paired Sampling ---
+# Each game index is a sampling unit. With mirror, the unit is the game played
+# twice with seats swapped on the same RNG (same dice stream): the luck of the
+# stream goes to a seat, not a faction, and the first-move advantage cancels
+# out of the faction's score. With a variant units.json, every unit is also
+# played with the variant on the same RNGs (common random numbers), so the
+# A/B difference is measured on matched games. The tallies carry the moments
+# of the per-unit scores of the games played (not of stored batches).
+
+MIN_UNITS = 30 # Units needed before their own variance is trusted
+
+def unit_stats(tally):
+    # (mean, variance) of the per-unit score of faction 1, and games per unit; None below 2 units
+    n = tally['units']
+    if n < 2:
+        return None
+    mean = tally['unit_sum'] / n
+    var = max(0.0, (tally['unit_sq'] - n * mean * mean) / (n - 1))
+    return mean, var, (tally['games'] - tally['cached']) / n
+
+def variance_reduction(tally):
+    # Games an unpaired estimate needs for the same interval, per game played
+    # (variance of single independent games / variance of the paired mean)
+    stats = unit_stats(tally)
+    if not stats or stats[1] == 0 or stats[2] <= 1:
+        return None
+    mean, var, per_unit = stats
+    played = tally['games'] - tally['cached']
+    game_var = max(0.0, tally['game_sq'] / played - mean * mean) * played / (played - 1)
+    return (game_var / played) / (var / tally['units'])
+
+def crn_difference(tally):
+    # Variant minus main score: (difference, its standard error with common random
+    # numbers, the same with independent games). None without a variant
+    variant = tally.get('variant')
+    a, b = unit_stats(tally), variant and unit_stats(variant)
+    if not a or not b:
+        return None
+    n = tally['units']
+    cov = (tally['cross'] - n * a[0] * b[0]) / (n - 1)
+    paired = max(0.0, a[1] + b[1] - 2 * cov)
+    return b[0] - a[0], math.sqrt(paired / n), math.sqrt((a[1] + b[1]) / n)
+
+def seat_score(tallies):
+    # Score of whoever moved first over the games played (0.5 = no first-move advantage); None if none
+    played = [t for t in tallies if not t['cached']]
+    games = sum(t['games'] for t in played)
+    draws = sum(t['draws'] for t in played)
+    wins = sum(t['seat_wins'] for t in played)
+    return (wins + 0.5 * draws) / games if games else None
+
+# Report text per language: each engine prints its report in its own
+# (simulation.py in Spanish, simulation_spatial.py in English)
+PAIRED_TEXT = {
+    'en': {
+        'seat': "First mover score: {:.1%} (50% = no advantage)",
+        'mirror_gain': ", mirrored pairs worth {:.2f}x as many single games",
+        'same_games': " | variant: same games (armies unchanged)",
+        'variant': " | variant {:+.1%} +- {:.1%} (independent games: +- {:.1%}",
+        'fewer': ", {:.1f}x fewer games)",
+        'mirror_mean': "Mean variance reduction from mirroring: {:.2f}x",
+        'crn_mean': "Mean variance reduction from common random numbers: {:.1f}x",
+    },
+    'es': {
+        'seat': "Puntuación de quien mueve primero: {:.1%} (50% = sin ventaja)",
+        'mirror_gain': ", cada par espejado vale {:.2f}x partidas sueltas",
+        'same_games': " | variante: mismas partidas (ejércitos sin cambios)",
+        'variant': " | variante {:+.1%} ± {:.1%} (partidas independientes: ± {:.1%}",
+        'fewer': ", {:.1f}x menos partidas)",
+        'mirror_mean': "Reducción media de varianza por el espejo: {:.2f}x",
+        'crn_mean': "Reducción media de varianza por números aleatorios comunes: {:.1f}x",
+    },
+}
+
+def paired_lines(pairs, tallies, mirror=False, lang="en"):
+    # Report lines for --mirror / --compare-units, one per pair plus totals.
+    # The first mover score only means something when seats were swapped
+    text = PAIRED_TEXT[lang]
+    seat = seat_score(tallies) if mirror else None
+    lines = [text['seat'].format(seat)] if seat is not None else []
+    for (f1, f2), t in zip(pairs, tallies):
+        line = f"{f1['code']} vs {f2['code']}: {pair_score(t):.1%}"
+        gain = variance_reduction(t)
+        if gain:
+            line += text['mirror_gain'].format(gain)
+        diff = crn_difference(t)
+        if diff and diff[2] and not (diff[0] or diff[1]):
+            line += text['same_games']
+        elif diff:
+            d, se, se_indep = diff
+            line += text['variant'].format(d, 1.96 * se, 1.96 * se_indep)
+            line += text['fewer'].format((se_indep / se) ** 2) if se else ")"
+        lines.append(line)
+    gains = [g for g in map(variance_reduction, tallies) if g]
+    if gains:
+        lines.append(text['mirror_mean'].format(sum(gains) / len(gains)))
+    diffs = [d for d in map(crn_difference, tallies) if d and d[1]]
+    if diffs:
+        lines.append(text['crn_mean'].format(sum((d[2] / d[1]) ** 2 for d in diffs) / len(diffs)))
+    return lines
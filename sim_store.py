@@ -0,0 +1,66 @@
+import json
+import sqlite3
+
+# --- Persistent Results Store (shared by simulation.py and simulation_spatial.py) ---
+# SQLite file of played batches. A batch is (key, first game index, count) plus
+# its tally; the key is (engine@version, pair, heroes, options, army fingerprints, seed).
+# Fingerprints cover only the compiled armies (see ArmyTemplate.fingerprint), so
+# editing one faction only invalidates the pairs it plays in.
+# Every game is fully determined by its key and index, so overlapping batches
+# agree and any non-overlapping selection of them is a valid result.
+
+TALLY_FIELDS = ('games', 'wins1', 'wins2', 'draws', 'turns1', 'turns2')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    engine TEXT, code1 TEXT, code2 TEXT, heroes INTEGER, options TEXT,
+    fingerprints TEXT, seed INTEGER, start INTEGER, count INTEGER,
+    games INTEGER, wins1 INTEGER, wins2 INTEGER, draws INTEGER, turns1 INTEGER, turns2 INTEGER
+);
+CREATE INDEX IF NOT EXISTS batches_key ON batches (engine, code1, code2, heroes, options, fingerprints, seed);
+"""
+
+class ResultsStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def pair_key(self, engine, code1, code2, fingerprint1, fingerprint2, use_heroes, options, seed):
+        return (engine, code1, code2, int(bool(use_heroes)),
+                json.dumps(options, sort_keys=True), f"{fingerprint1}-{fingerprint2}", seed)
+
+    def stored_batches(self, key, first, end):
+        # Non-overlapping stored batches inside [first, end), as (start, count, tally)
+        rows = self.db.execute(
+            "SELECT start, count, " + ", ".join(TALLY_FIELDS) + " FROM batches "
+            "WHERE engine=? AND code1=? AND code2=? AND heroes=? AND options=? AND fingerprints=? AND seed=? "
+            "AND start>=? AND start+count<=? ORDER BY start, count DESC", key + (first, end)).fetchall()
+        picked = []
+        covered = first
+        for row in rows:
+            if row[0] >= covered:
+                picked.append((row[0], row[1], dict(zip(TALLY_FIELDS, row[2:]))))
+                covered = row[0] + row[1]
+        return picked
+
+    def add_batch(self, key, start, count, tally):
+        # Committed per batch, so an interrupted sweep keeps everything played so far
+        self.db.execute("INSERT INTO batches VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                        key + (start, count) + tuple(tally[f] for f in TALLY_FIELDS))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+def missing_spans(batches, first, end):
+    # Gaps of [first, end) not covered by the (sorted, non-overlapping) batches
+    gaps = []
+    pos = first
+    for start, count, _ in batches:
+        if start > pos:
+            gaps.append((pos, start - pos))
+        pos = start + count
+    if pos < end:
+        gaps.append((pos, end - pos))
+    return gaps
@@ -0,0 +1,218 @@
+import io
+import csv
+import argparse
+
+import sim_cards
+import sim_data
+import sim_dice
+import sim_runner
+import sim_store
+import simulation
+import simulation_spatial
+
+# --- Stat Sensitivity Sweep (units.json parameters, either engine) ---
+# Each --param varies one field of one unit over a list of values, with the
+# rest of units.json as it is, and gives one response curve: the unit's faction
+# score against each opponent per value. A variant only replays the pairs whose
+# compiled armies it changes (army fingerprints); every other pair, and every
+# value equal to the current one, reuses the baseline result. All runs share
+# the seed, so a curve is measured on common random numbers. Runs go to the
+# workers as (unit, field, value) patches and play in one pool.
+
+ENGINES = {'simulation': simulation.Game, 'simulation_spatial': simulation_spatial.Game}
+SWEEP_FIELDS = ('strength', 'movement', 'range', 'cost', 'type') # Read by Unit.__init__
+EXCLUDED_FACTIONS = ('neutral', 'mercenaries', 'titans', 'inferno') # As run_simulations
+UNIT_DEFAULTS = {'strength': 4, 'movement': 2, 'range': 1, 'cost': 0} # Unit.__init__ defaults
+CSV_FIELDS = ('param', 'value', 'current', 'opponent', 'games', 'wins', 'draws', 'losses', 'score', 'score_lo',
+              'score_hi', 'reused')
+
+def parse_param(text, units):
+    # "am1.strength=2,3,5" or "am1.strength=2:5" (inclusive) -> (unit id, field, [values])
+    try:
+        target, values = text.split("=", 1)
+        unit_id, field = target.split(".", 1)
+    except ValueError:
+        raise ValueError(f"Bad --param '{text}' (use unit.field=v1,v2 or unit.field=lo:hi)")
+    if field not in SWEEP_FIELDS:
+        raise ValueError(f"Bad --param '{text}': field must be one of {', '.join(SWEEP_FIELDS)}")
+    if unit_id not in {u['id'] for u in units}:
+        raise ValueError(f"Bad --param '{text}': unknown unit {unit_id}")
+    if field == 'type':
+        parsed = values.split(",")
+        bad = [v for v in parsed if v not in simulation.UNIT_TYPE_VALUES]
+        if bad:
+            raise ValueError(f"Bad --param '{text}': unknown type {', '.join(bad)}")
+    elif ":" in values:
+        lo, hi = values.split(":", 1)
+        parsed = list(range(int(lo), int(hi) + 1))
+    else:
+        parsed = [int(v) for v in values.split(",")]
+    return unit_id, field, parsed
+
+def plan(game_cls, pairs, units, params, use_heroes=False):
+    # (runs, curves). runs: the (patch, pair index) to play, baseline patch () included.
+    # curves: one per param, [(value, patch, changed pair indexes, is current value)] per value
+    codes = {f['code'] for pair in pairs for f in pair}
+    base = {code: game_cls.army_fingerprint(code, units, use_heroes) for code in codes}
+    by_id = {u['id']: u for u in units}
+    runs = set()
+    curves = []
+    for unit_id, field, values in params:
+        faction = by_id[unit_id]['faction']
+        current = by_id[unit_id].get(field, UNIT_DEFAULTS.get(field))
+        involved = [p for p, (f1, f2) in enumerate(pairs) if faction in (f1['code'], f2['code'])]
+        runs.update(((), p) for p in involved)
+        points = []
+        for value in values:
+            patch = ((unit_id, field, value),)
+            variant = sim_runner.patched_units(units, patch)
+            changed = {code for code in codes if game_cls.army_fingerprint(code, variant, use_heroes) != base[code]}
+            changed_pairs = [p for p, (f1, f2) in enumerate(pairs) if {f1['code'], f2['code']} & changed]
+            runs.update((patch, p) for p in changed_pairs)
+            points.append((value, patch, changed_pairs, value == current))
+        curves.append((unit_id, field, faction, involved, points))
+    # Baseline first, then in parameter order: same job order every run
+    order = {(): 0}
+    for _, _, _, _, points in curves:
+        for _, patch, _, _ in points:
+            order.setdefault(patch, len(order))
+    return sorted(runs, key=lambda r: (order[r[0]], r[1])), curves
+
+def run_sweep(game_cls, pairs, params, n_games, data, use_heroes=False, seed=0, workers=1, game_kwargs=None,
+              store=None, mirror=False):
+    # Returns (tallies by (patch, pair index), curves); see plan()
+    units, cards = data.units, data.cards
+    game_kwargs = game_kwargs or {}
+    runs, curves = plan(game_cls, pairs, units, params, use_heroes)
+    tallies = [sim_runner.empty_tally() for _ in runs]
+    index = {run: r for r, run in enumerate(runs)}
+
+    keys = {}
+    jobs = []
+    for patch in dict.fromkeys(patch for patch, _ in runs):
+        spans = []
+        for (run_patch, p), r in index.items():
+            if run_patch != patch:
+                continue
+            gaps = [(0, n_games)]
+            if store:
+                variant = sim_runner.patched_units(units, patch)
+                keys[r] = sim_runner.store_keys(store, game_cls, [pairs[p]], variant, cards, use_heroes, game_kwargs,
+                                                seed, mirror)[0]
+                batches = store.stored_batches(keys[r], 0, n_games)
+                for _, _, t in batches:
+                    sim_runner.merge_tally(tallies[r], t)
+                    tallies[r]['cached'] += t['games']
+                gaps = sim_store.missing_spans(batches, 0, n_games)
+            spans.extend((p, start, count) for start, count in gaps)
+        # Jobs come back with the pair index first: swap in the run index
+        jobs.extend((index[(patch, job[0])],) + job[1:] for job in sim_runner.chunk_jobs(
+            game_cls, pairs, spans, seed, use_heroes, max(1, workers), game_kwargs, mirror=mirror, patch=patch))
+
+    def on_done(job, t):
+        if store:
+            store.add_batch(keys[job[0]], job[4], job[5], t)
+    with sim_runner.worker_pool(units, cards, workers, data.path) as pool:
+        sim_runner.play_jobs(pool, jobs, tallies, on_done)
+    return {run: tallies[r] for run, r in index.items()}, curves
+
+def curve_rows(pairs, results, curves):
+    # One row per (param, value, opponent) plus an 'all' row, from the swept faction's side
+    rows = []
+    for unit_id, field, faction, involved, points in curves:
+        for value, patch, changed, current in points:
+            total = [0, 0, 0, 0]
+            for p in involved:
+                f1, f2 = pairs[p]
+                reused = p not in changed
+                t = results[((), p) if reused else (patch, p)]
+                first = f1['code'] == faction
+                wins, losses = (t['wins1'], t['wins2']) if first else (t['wins2'], t['wins1'])
+                opponent = f2['code'] if first else f1['code']
+                rows.append(_row(unit_id, field, value, current, opponent, wins, t['draws'], losses, reused))
+                for i, v in enumerate((wins, t['draws'], losses, int(reused))):
+                    total[i] += v
+            rows.append(_row(unit_id, field, value, current, 'all', total[0], total[1], total[2],
+                             total[3] == len(involved)))
+    return rows
+
+def _row(unit_id, field, value, current, opponent, wins, draws, losses, reused):
+    games = wins + draws + losses
+    score = (wins + 0.5 * draws) / games if games else 0.5
+    lo, hi = sim_runner.wilson_interval(score, games)
+    return {'param': f"{unit_id}.{field}", 'value': value, 'current': current, 'opponent': opponent, 'games': games,
+            'wins': wins, 'draws': draws, 'losses': losses, 'score': score, 'score_lo': lo, 'score_hi': hi,
+            'reused': reused}
+
+def to_csv(rows):
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(CSV_FIELDS)
+    for r in rows:
+        w.writerow([f"{r[k]:.4f}" if isinstance(r[k], float) else r[k] for k in CSV_FIELDS])
+    return buf.getvalue()
+
+def to_markdown(rows, curves):
+    # One table per param: values down, opponents across (score, draws = 1/2)
+    lines = []
+    for unit_id, field, faction, _, _ in curves:
+        param = f"{unit_id}.{field}"
+        mine = [r for r in rows if r['param'] == param]
+        opponents = list(dict.fromkeys(r['opponent'] for r in mine))
+        lines.append(f"## {param} ({faction})\n")
+        lines.append("| value | " + " | ".join(opponents) + " |")
+        lines.append("|---" * (len(opponents) + 1) + "|")
+        for value in dict.fromkeys(r['value'] for r in mine):
+            cells = {r['opponent']: r for r in mine if r['value'] == value}
+            label = str(value)
+            if cells['all']['current']:
+                label += " (current)"
+            elif cells['all']['reused']:
+                label += " (same armies)" # e.g. a cost that changes neither count nor hero status
+            lines.append(f"| {label} | " + " | ".join(
+                f"{cells[o]['score']:.1%} ±{(cells[o]['score_hi'] - cells[o]['score_lo']) / 2:.1%}" for o in opponents) + " |")
+        lines.append("")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--param", action="append", required=True,
+                        help=f"unit.field=v1,v2 or unit.field=lo:hi, field in {', '.join(SWEEP_FIELDS)}; repeatable")
+    parser.add_argument("--engine", choices=list(ENGINES), default="simulation")
+    parser.add_argument("--games", type=int, default=200, help="Games per matchup and value")
+    parser.add_argument("--heroes", action="store_true")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed, shared by every value (common random numbers)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--dice", choices=sim_dice.DICE_MODES, default="roll")
+    parser.add_argument("--cards", choices=sim_cards.CARD_MODES, default="deck")
+    parser.add_argument("--mirror", action="store_true", help="Also play every game with seats swapped on the same dice")
+    parser.add_argument("--store", default=None, help="SQLite results store, shared with the simulators")
+    parser.add_argument("--csv", default=None, help="Write the response curves here")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args()
+
+    data = sim_data.load(args.data_dir)
+    try:
+        params = [parse_param(text, data.units) for text in args.param]
+    except ValueError as e:
+        parser.error(str(e))
+    factions = [f for f in data.factions if f['code'] not in EXCLUDED_FACTIONS]
+    pairs = [(factions[i], factions[j]) for i in range(len(factions)) for j in range(i + 1, len(factions))]
+    game_cls = ENGINES[args.engine]
+    store = sim_store.ResultsStore(args.store) if args.store else None
+
+    results, curves = run_sweep(game_cls, pairs, params, args.games, data, args.heroes, args.seed, args.workers,
+                                {'dice_mode': args.dice, 'card_mode': args.cards}, store, args.mirror)
+    if store:
+        store.close()
+    rows = curve_rows(pairs, results, curves)
+    played = sum(t['games'] - t['cached'] for t in results.values())
+    naive = sum(len(points) for *_, points in curves) * len(pairs) * args.games * (2 if args.mirror else 1)
+    print(f"# Barrido de sensibilidad ({game_cls.engine}) | Semilla: {args.seed}")
+    print(f"Emparejamientos jugados: {len(results)} | Partidas jugadas: {played} "
+          f"(barrido completo: {naive}) | Del almacén: {sum(t['cached'] for t in results.values())}\n")
+    print(to_markdown(rows, curves))
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            f.write(to_csv(rows))
+        print(f"CSV: {args.csv}")
@@ -1,94 +1,124 @@
-import json
 import random
+import hashlib
 import argparse
-import os
-import math
+from bisect import insort
 from collections import defaultdict
 from enum import Enum
 
+import sim_agents
+import sim_cards
+import sim_data
+import sim_dice
+import sim_profile
+import sim_report
+import sim_runner
+import sim_store
+from sim_events import EV_HIT, EV_KILL, EV_MOVE, EV_CARD, EV_END
+
 # --- Constants & Enums ---
 
+# Bump whenever game logic changes: cached results of older versions are not reused
+ENGINE_VERSION = 2
+
 class UnitType(Enum):
     LIGHT = "light"
     MEDIUM = "medium"
     HEAVY = "heavy"
     ELITE = "elite" # For Heroes or special units
 
-class DieFace(Enum):
-    SWORD = "sword"   # 1
-    FLAG = "flag"     # 2
-    CIRCLE = "circle" # 3 (Light)
-    TRIANGLE = "triangle" # 4 (Medium)
-    SQUARE = "square" # 5 (Heavy)
-    MAGIC = "magic"   # 6
-
-# Probabilities are 1/6 for each face
-DICE_FACES = [
-    DieFace.SWORD, DieFace.FLAG, DieFace.CIRCLE,
-    DieFace.TRIANGLE, DieFace.SQUARE, DieFace.MAGIC
-]
+UNIT_TYPE_VALUES = {t.value for t in UnitType}
 
 SECTION_LEFT = "left"
 SECTION_CENTER = "center"
 SECTION_RIGHT = "right"
 SECTIONS = [SECTION_LEFT, SECTION_CENTER, SECTION_RIGHT]
 
-# --- Data Loading ---
-
-def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
 # --- Classes ---
 
 class Unit:
+    # Battle state only (slots, integer type code); names and other metadata in info
+    __slots__ = ('id', 'type', 'type_code', 'max_strength', 'current_strength', 'movement', 'range_val',
+                 'is_hero', 'info', 'section', 'player', 'index')
+
     def __init__(self, data, faction_id):
         self.id = data['id']
-        self.name_es = data['name']['es']
-        self.faction = faction_id
-        self.type = UnitType(data['type']) if data['type'] in [t.value for t in UnitType] else UnitType.MEDIUM
+        self.type = UnitType(data['type']) if data['type'] in UNIT_TYPE_VALUES else UnitType.MEDIUM
         # Default subtype to unit if missing
-        self.subtype = data.get('subtype', 'unit')
+        subtype = data.get('subtype', 'unit')
         
         self.max_strength = data.get('strength', 4)
         self.current_strength = self.max_strength
         self.movement = data.get('movement', 2)
         self.range_val = data.get('range', 1)
-        self.cost = data.get('cost', 0)
+        cost = data.get('cost', 0)
         
         self.is_hero = "Hero" in data.get('traits', []) # Inferred, might need better check from rules
         # Manual fix for heroes based on description/cost/stats if trait missing
-        if self.cost >= 6 or self.subtype == 'hero':
+        if cost >= 6 or subtype == 'hero':
              self.is_hero = True
              self.type = UnitType.ELITE # Heroes have elite defense usually
+        self.type_code = sim_dice.TYPE_CODE[self.type.value]
 
         self.section = None # location on board
-        self.has_moved = False
-        self.has_attacked = False
+        self.player = None # owning Player, notified on death
+        self.index = None # order in Player.units (keeps rosters in a stable order)
+        
+        # Only needed for logging and reports; one dict per definition, shared by the clones,
+        # so units of a patched or compared units.json keep their own
+        self.info = {'name_es': data['name']['es'], 'faction': faction_id, 'subtype': subtype, 'cost': cost}
+
+    @property
+    def name_es(self): return self.info['name_es']
+
+    @property
+    def faction(self): return self.info['faction']
+
+    @property
+    def subtype(self): return self.info['subtype']
+
+    @property
+    def cost(self): return self.info['cost']
+
+    def clone(self):
+        # Fresh copy of a template unit: every slot is an immutable scalar
+        u = Unit.__new__(Unit)
+        u.id = self.id
+        u.type = self.type
+        u.type_code = self.type_code
+        u.max_strength = self.max_strength
+        u.current_strength = self.current_strength
+        u.movement = self.movement
+        u.range_val = self.range_val
+        u.is_hero = self.is_hero
+        u.info = self.info
+        u.section = self.section
+        u.player = self.player
+        u.index = self.index
+        return u
 
     def is_alive(self):
         return self.current_strength > 0
 
     def take_damage(self, hits):
+        was_alive = self.current_strength > 0
         self.current_strength = max(0, self.current_strength - hits)
+        if was_alive and self.current_strength == 0 and self.player:
+            self.player.unit_died(self)
 
-    def can_be_hit_by(self, face):
-        if face == DieFace.SWORD: return True
-        if self.type == UnitType.LIGHT and face in [DieFace.CIRCLE, DieFace.MAGIC]: return True
-        if self.type == UnitType.MEDIUM and face == DieFace.TRIANGLE: return True
-        if self.type == UnitType.HEAVY and face == DieFace.SQUARE: return True
-        return False
-
-class Player:
-    def __init__(self, faction_code, faction_name, units_data, use_heroes=False):
+class ArmyTemplate:
+    # Compiled once per (units data, faction, heroes, army); build() clones fresh Units for each game
+    def __init__(self, faction_code, units_data, use_heroes=False, army=None):
         self.faction_code = faction_code
-        self.faction_name = faction_name
         self.units = []
-        self.mana = 0
-        self.medals = 0
-        self.hand = [] # Cards
+
+        # Point-buy army (sim_army): (unit id, copies) pairs instead of the box set below
+        if army is not None:
+            defs = {u['id']: u for u in units_data}
+            for unit_id, count in army:
+                for _ in range(count):
+                    self.units.append(Unit(defs[unit_id], faction_code))
+            return
         
-        # Build Army
         faction_units_defs = [u for u in units_data if u['faction'] == faction_code and u['expansion'] == 'base']
         
         # Standard Units
@@ -103,31 +133,132 @@ class Player:
             hero_def = next((u for u in units_data if u['faction'] == faction_code and u.get('subtype') == 'hero'), None)
             if hero_def:
                 self.units.append(Unit(hero_def, faction_code))
-                
+
+    def build(self):
+        return [u.clone() for u in self.units]
+
+    def fingerprint(self):
+        # Hash of the battle-relevant compiled army (not names or rules text)
+        state = [(u.id, u.type_code, u.max_strength, u.movement, u.range_val, u.is_hero) for u in self.units]
+        return hashlib.sha256(repr(state).encode('utf-8')).hexdigest()[:16]
+
+_army_templates = {}
+
+def get_army_template(faction_code, units_data, use_heroes=False, army=None):
+    # Keyed on the units_data object itself: reloading units.json gives a new template
+    key = (id(units_data), faction_code, use_heroes, army)
+    entry = _army_templates.get(key)
+    if entry is None or entry[0] is not units_data:
+        entry = (units_data, ArmyTemplate(faction_code, units_data, use_heroes, army))
+        _army_templates[key] = entry
+    return entry[1]
+
+class Player:
+    def __init__(self, faction_code, faction_name, units_data, use_heroes=False, army=None):
+        self.faction_code = faction_code
+        self.faction_name = faction_name
+        self.mana = 0
+        self.medals = 0
+        self.hand = [] # Cards
+        
+        # Build Army (fresh copies of the cached faction template)
+        self.units = get_army_template(faction_code, units_data, use_heroes, army).build()
+        
         # Initial positioning (Abstracted)
         # Distribute evenly across sections
         for i, u in enumerate(self.units):
             u.section = SECTIONS[i % 3]
+            u.player = self
+            u.index = i
 
-    def get_alive_units(self):
-        return [u for u in self.units if u.is_alive()]
+        # Live rosters, kept in Player.units order and updated as units die or move
+        self.alive = list(self.units)
+        self.alive_by_section = {s: [u for u in self.units if u.section == s] for s in SECTIONS}
+        self.type_counts = [0] * len(sim_dice.UNIT_TYPES)
+        for u in self.units:
+            self.type_counts[u.type_code] += 1
+        # The same live lists, as the command cards see them
+        self.roster = sim_cards.Roster(self.alive_by_section, self.alive, self.type_counts, self.section_mates)
+
+    def rebuild_rosters(self):
+        # After Game.restore: the live lists again from strengths and sections, in
+        # place (the roster holds them)
+        self.alive[:] = [u for u in self.units if u.current_strength > 0]
+        for s, units in self.alive_by_section.items():
+            units[:] = [u for u in self.alive if u.section == s]
+        self.type_counts[:] = [0] * len(self.type_counts)
+        for u in self.alive:
+            self.type_counts[u.type_code] += 1
+
+    def unit_died(self, unit):
+        self.alive.remove(unit)
+        self.alive_by_section[unit.section].remove(unit)
+        self.type_counts[unit.type_code] -= 1
+
+    def section_mates(self, unit):
+        # No hexes here: units of the same section count as adjacent
+        return [u for u in self.alive_by_section[unit.section] if u is not unit]
+
+    def move_to_section(self, unit, section):
+        self.alive_by_section[unit.section].remove(unit)
+        unit.section = section
+        insort(self.alive_by_section[section], unit, key=lambda u: u.index)
+
+    def alive_count(self):
+        return len(self.alive)
 
 class Game:
-    def __init__(self, faction1_def, faction2_def, units_data, cards_data, use_heroes=False):
-        self.p1 = Player(faction1_def['code'], faction1_def['name']['es'], units_data, use_heroes)
-        self.p2 = Player(faction2_def['code'], faction2_def['name']['es'], units_data, use_heroes)
+    engine = "sectional" # Results store key
+    unit_cls = Unit # sim_army classifies units.json entries with it
+    version = ENGINE_VERSION
+
+    @staticmethod
+    def army_fingerprint(faction_code, units_data, use_heroes=False, army=None):
+        return get_army_template(faction_code, units_data, use_heroes, army).fingerprint()
+
+    @staticmethod
+    def profile_hooks():
+        # sim_profile wrappers, only installed while profiling (kinds in sim_profile)
+        return [
+            ('phase', 'game', Game, 'run'),
+            ('phase', 'setup', Game, '__init__'),
+            ('phase', 'cards', Game, 'play_card'),
+            ('phase', 'cards', Game, 'abstract_activations'),
+            ('phase', 'movement', Player, 'move_to_section'),
+            ('phase', 'combat', Game, 'resolve_combat'),
+            ('phase', 'victory', Player, 'alive_count'),
+            ('dice', 'dice', sim_dice.DiceEngine, 'hits_flags'),
+            ('dice', 'dice', sim_dice.DiceEngine, '_table_hits_flags'),
+            ('count', 'attacks', Game, 'resolve_combat'),
+            ('move', 'moves', Player, 'move_to_section', 'section'),
+        ]
+
+    def __init__(self, faction1_def, faction2_def, units_data, cards_data, use_heroes=False, rng=None, dice_mode="roll",
+                 card_mode="deck", armies=None, agents=None):
+        self.rng = rng or random.Random()
+        # dice_mode: "roll" draws every face, "table" samples exact outcome tables (1 rng call/attack)
+        self.dice = sim_dice.DiceEngine(self.rng, mode=dice_mode)
+        # armies: {faction code: point-buy army} (sim_army); other factions field the box set
+        armies = armies or {}
+        self.p1 = Player(faction1_def['code'], faction1_def['name']['es'], units_data, use_heroes,
+                         armies.get(faction1_def['code']))
+        self.p2 = Player(faction2_def['code'], faction2_def['name']['es'], units_data, use_heroes,
+                         armies.get(faction2_def['code']))
+        # Both armies in one flat list, for sim_agents.GameState
+        self.units = self.p1.units + self.p2.units
+        self.owners = [1] * len(self.p1.units) + [2] * len(self.p2.units)
         self.cards_data = cards_data
+        # card_mode: "deck" plays real command cards from cards.json, "abstract" the old fixed 3 activations
+        self.deck = None
+        if card_mode == "deck":
+            self.deck = sim_cards.Deck(sim_cards.get_deck_template(cards_data), self.rng)
+            self.deck.draw_into(self.p1.hand, sim_cards.HAND_SIZE)
+            self.deck.draw_into(self.p2.hand, sim_cards.HAND_SIZE)
         self.turn_count = 0
         self.max_turns = 200 # Increased from 50
-        self.log = []
-        self.verbose = False # Toggle via arg pass later or just hack it
-
-    def log_event(self, msg):
-        self.log.append(msg)
-        if self.verbose: print(msg)
-
-    def roll_dice(self, count):
-        return [random.choice(DICE_FACES) for _ in range(count)]
+        self.events = None # Optional sim_events sink (None = no logging cost)
+        # agents: {faction code: agent or spec} choosing that faction's cards (sim_agents); None = heuristic
+        self.agents = sim_agents.make_agents(agents)
 
     def resolve_combat(self, attacker, defender, range_combat=False, distance=1):
         dice_count = attacker.current_strength
@@ -136,19 +267,9 @@ class Game:
             if distance > 1:
                 dice_count = max(1, dice_count - 1)
         
-        rolls = self.roll_dice(dice_count)
-        hits = 0
-        flags = 0
-        
-        for face in rolls:
-            if defender.can_be_hit_by(face):
-                hits += 1
-            elif face == DieFace.FLAG:
-                flags += 1
-            elif face == DieFace.MAGIC:
-                # Simple logic: If magic didn't hit (not light), attacker gains mana
-                # Not fully implementing attacker.owner.mana += 1 logic complexity here primarily for stats
-                pass
+        # Batched lookup: hit mask per defender type, flags counted on the raw faces.
+        # Magic faces that miss would give the attacker mana (not modelled here).
+        hits, flags = self.dice.hits_flags(dice_count, defender.type_code)
 
         # Damage
         defender.take_damage(hits)
@@ -156,26 +277,23 @@ class Game:
         # Report
         return hits, flags
 
-    def play_turn(self, player, opponent):
+    def play_turn(self, player, opponent, choice=None):
+        # choice: (hand index, option) to play instead of asking the agent / heuristic
+        if self.agents and choice is None and self.deck and player.alive:
+            agent = self.agents.get(player.faction_code)
+            if agent:
+                choice = agent.choose_card(self, self.player_num(player))
+
         # 1. Gain Mana
-        player.mana += 1 # Base generation
-        
-        # 2. Card Phase (Abstracted)
-        # Assume player draws a card that activates units in a section with most units
-        # Simple AI: activating section with most ready units
-        
-        section_counts = defaultdict(int)
-        for u in player.get_alive_units():
-            section_counts[u.section] += 1
+        player.mana = min(sim_cards.MAX_MANA, player.mana + 1) # Base generation
         
-        if not section_counts:
+        # 2. Card Phase
+        if not player.alive:
             return # No units left
-            
-        best_section = max(section_counts, key=section_counts.get)
-        active_units = [u for u in player.get_alive_units() if u.section == best_section]
-        
-        # Limit to 3 activations (standard card avg)
-        active_units = active_units[:3]
+        if self.deck:
+            active_units = self.play_card(player, opponent, choice)
+        else:
+            active_units = self.abstract_activations(player)
         
         # 3. Action Phase for activated units
         for unit in active_units:
@@ -183,20 +301,23 @@ class Game:
             # In this abstract sim, we just check if can attack
             
             # Find target in same section
-            enemies = [e for e in opponent.get_alive_units() if e.section == unit.section]
+            enemies = opponent.alive_by_section[unit.section]
             
             if not enemies:
                 # No enemies in this section! Move to a section with enemies.
-                enemy_sections = list(set(e.section for e in opponent.get_alive_units()))
+                # (fixed SECTIONS order, a set of strings would vary with hash seeding)
+                enemy_sections = [sec for sec in SECTIONS if opponent.alive_by_section[sec]]
                 if enemy_sections:
                     # Move to random populated section
-                    # self.log_event(f"{unit.name_es} moves from {unit.section} to {enemy_sections[0]}")
-                    unit.section = random.choice(enemy_sections)
+                    from_section = unit.section
+                    player.move_to_section(unit, self.rng.choice(enemy_sections))
+                    if self.events:
+                        self.events.emit((EV_MOVE, self.turn_count, self.player_num(player), unit.id, from_section, unit.section))
                     # End activation (Move action consumes turn usually unless special)
                     continue
             
             if enemies:
-                target = random.choice(enemies) # Random target in lane
+                target = self.rng.choice(enemies) # Random target in lane
                 
                 # Check range
                 dist = 1 # melee
@@ -210,25 +331,146 @@ class Game:
                 is_ranged = unit.range_val > 1
                 hits, flags = self.resolve_combat(unit, target, range_combat=is_ranged, distance=(2 if is_ranged else 1))
                 
-                if hits > 0:
-                    self.log_event(f"{unit.name_es} hits {target.name_es} for {hits} dmg")
+                if hits > 0 and self.events:
+                    self.events.emit((EV_HIT, self.turn_count, self.player_num(player), unit.id, target.id, hits, flags))
                 
                 if not target.is_alive():
-                    self.log_event(f"{target.name_es} eliminated!")
+                    if self.events:
+                        self.events.emit((EV_KILL, self.turn_count, self.player_num(player), target.id))
                     player.medals += 1
 
+    def abstract_activations(self, player):
+        # Assume player draws a card that activates units in a section with most units
+        # Simple AI: activating section with most ready units
+        
+        # Populated sections, in the order their first unit appears in the army
+        populated = sorted((sec for sec in SECTIONS if player.alive_by_section[sec]),
+                           key=lambda sec: player.alive_by_section[sec][0].index)
+        best_section = max(populated, key=lambda sec: len(player.alive_by_section[sec]))
+        
+        # Limit to 3 activations (standard card avg)
+        return player.alive_by_section[best_section][:3]
+
+    def play_card(self, player, opponent, choice=None):
+        # Best card/option of the hand (or choice); returns the units it activates
+        roster = player.roster
+        i, option = choice or sim_cards.choose(player.hand, roster, player.mana)
+        card = player.hand.pop(i)
+        if self.events:
+            self.events.emit((EV_CARD, self.turn_count, self.player_num(player), card.id,
+                              "A" if option is card.options[0] else "B"))
+        if option.special:
+            player.mana = min(sim_cards.MAX_MANA, player.mana + option.mana_gain) - option.mana_cost
+            if option.spell == 'damage':
+                self.spell_damage(player, opponent, card.id, option.amount)
+            elif option.spell == 'heal':
+                self.spell_heal(player, option.amount)
+        sim_cards.refill(self.deck, player.hand, card, option)
+        return option.select(roster)
+
+    def spell_damage(self, player, opponent, card_id, strength):
+        # Area spell: `strength` dice on the first enemy of the most crowded section
+        section = max(SECTIONS, key=lambda sec: len(opponent.alive_by_section[sec]))
+        if not opponent.alive_by_section[section]:
+            return
+        target = opponent.alive_by_section[section][0]
+        hits, flags = self.dice.hits_flags(strength, target.type_code)
+        target.take_damage(hits)
+        if hits > 0 and self.events:
+            self.events.emit((EV_HIT, self.turn_count, self.player_num(player), card_id, target.id, hits, flags))
+        if not target.is_alive():
+            if self.events:
+                self.events.emit((EV_KILL, self.turn_count, self.player_num(player), target.id))
+            player.medals += 1
+
+    def spell_heal(self, player, amount):
+        # Most wounded unit (first in army order on ties)
+        wounded = max(player.alive, key=lambda u: u.max_strength - u.current_strength)
+        wounded.current_strength = min(wounded.max_strength, wounded.current_strength + amount)
+
+    def player_num(self, player):
+        return 1 if player is self.p1 else 2
+
+    def unit_info(self):
+        # unit id -> Unit.info of this game's units, for event sinks that print names
+        return {u.id: u.info for u in self.units}
+
+    def player(self, player_num):
+        return self.p1 if player_num == 1 else self.p2
+
+    def hand(self, player_num):
+        return self.player(player_num).hand
+
+    def turn_mana(self, player_num):
+        # Mana for the card of player_num's next turn (play_turn's gain)
+        return min(sim_cards.MAX_MANA, self.player(player_num).mana + 1)
+
+    # --- Fork / Restore (sim_agents) ---
+
+    def fork(self):
+        units = self.units
+        return sim_agents.GameState([u.current_strength for u in units], [u.section for u in units], self.owners,
+                                    (self.p1.medals, self.p2.medals), (self.p1.mana, self.p2.mana), self.turn_count,
+                                    (list(self.p1.hand), list(self.p2.hand)), self.deck and self.deck.state(),
+                                    self.dice.state())
+
+    def restore(self, state):
+        for u, strength, section in zip(self.units, state.strength, state.pos):
+            u.current_strength = strength
+            u.section = section
+        self.p1.rebuild_rosters()
+        self.p2.rebuild_rosters()
+        self.p1.medals, self.p2.medals = state.medals
+        self.p1.mana, self.p2.mana = state.mana
+        self.turn_count = state.turn
+        self.p1.hand, self.p2.hand = list(state.hands[0]), list(state.hands[1])
+        if self.deck:
+            self.deck.restore(state.deck)
+        self.dice.restore(state.dice)
+
+    def use_rng(self, rng):
+        # Every random draw of the game (dice, targets, deck) from rng from now on
+        self.rng = rng
+        self.dice.reseed(rng)
+        if self.deck:
+            self.deck.rng = rng
+
+    def half_turn(self, player_num, choice=None):
+        # One player's turn; True if it wins the game
+        player, opponent = (self.p1, self.p2) if player_num == 1 else (self.p2, self.p1)
+        self.play_turn(player, opponent, choice)
+        return opponent.alive_count() == 0 or player.medals >= 5 # Victory condition: 5 medals or wipe
+
+    def advance(self, player_num, half_turns, choice=None):
+        # Rollouts: up to half_turns turns from the start of player_num's (already
+        # counted in turn_count), the first playing choice. The winner's number,
+        # 0 for a draw on turns, None if the game goes on
+        for h in range(half_turns):
+            if h and player_num == 1:
+                if self.turn_count >= self.max_turns:
+                    return 0 if self.p1.medals == self.p2.medals else (1 if self.p1.medals > self.p2.medals else 2)
+                self.turn_count += 1
+            if self.half_turn(player_num, None if h else choice):
+                return player_num
+            player_num = 3 - player_num
+        return None
+
     def run(self):
+        winner = self._play_game()
+        if self.events:
+            self.events.emit((EV_END, self.turn_count, winner))
+        return winner
+
+    def _play_game(self):
         while self.turn_count < self.max_turns:
             self.turn_count += 1
             
             # P1 Turn
-            self.play_turn(self.p1, self.p2)
-            if len(self.p2.get_alive_units()) == 0 or self.p1.medals >= 5: # Victory condition: 5 medals or wipe
+            if self.half_turn(1):
                 return self.p1.faction_code
                 
             # P2 Turn
-            self.play_turn(self.p2, self.p1)
-            if len(self.p1.get_alive_units()) == 0 or self.p2.medals >= 5:
+            if self.half_turn(2):
                 return self.p2.faction_code
                 
                 return self.p2.faction_code
@@ -240,11 +482,13 @@ class Game:
         else:
             return "draw"
 
-def run_simulations(n_games):
-    data_dir = "d:/Devel/Proyectos/personal/war-hex-echoes-of-magic/data" # Adjust if needed
-    units = load_json(os.path.join(data_dir, "units.json"))
-    factions = load_json(os.path.join(data_dir, "factions.json"))
-    cards = load_json(os.path.join(data_dir, "cards.json"))
+def run_simulations(n_games, use_heroes=False, seed=None, workers=1, dice_mode="roll", debug=False, trace_dir=None,
+                    precision=None, store_path=None, report_only=False, data_dir=None,
+                    matrix_paths=None, card_mode="deck", profile_mode=None, profile_path=None,
+                    mirror=False, compare_units=None):
+    # Validated JSON, compiled to a snapshot that is rebuilt when the sources change
+    data = sim_data.load(data_dir)
+    units, factions, cards = data.units, data.factions, data.cards
     
     # Filter valid factions (exclude neutral/mercs/titans/inferno for now as per request)
     valid_factions = [f for f in factions if f['code'] not in ['neutral', 'mercenaries', 'titans', 'inferno']]
@@ -258,42 +502,69 @@ def run_simulations(n_games):
         for j in range(i + 1, len(valid_factions)):
             pairs.append((valid_factions[i], valid_factions[j]))
             
-    # Iterate all pairs
-    # Force verbose for first game to debug
-    first_run = True
-    
-    for f1, f2 in pairs:
+    # A results store is only reusable with a fixed seed: default to 0 there
+    if seed is None:
+        seed = 0 if store_path else sim_runner.new_seed()
+    store = sim_store.ResultsStore(store_path) if store_path else None
+    print(f"Semilla: {seed} | Procesos: {workers} | Dados: {dice_mode} | Cartas: {card_mode}")
+
+    # Iterate all pairs, split in (pair, game-chunk) units across the workers
+    # --debug prints the first game's events, --trace streams every game to JSONL
+    game_kwargs = {'dice_mode': dice_mode, 'card_mode': card_mode}
+    run_args = dict(use_heroes=use_heroes, seed=seed, workers=workers, game_kwargs=game_kwargs,
+                    debug_first=debug, trace_dir=trace_dir, store=store, report_only=report_only,
+                    snapshot=data.path)
+    # --matrix: N x N matrix files, rewritten as chunks finish
+    matrix = None
+    if matrix_paths:
+        matrix = sim_report.MatrixWriter(matrix_paths, [(f1['code'], f2['code']) for f1, f2 in pairs],
+                                         meta={'engine': Game.engine, 'seed': seed, 'heroes': use_heroes, 'dice': dice_mode,
+                                               'cards': card_mode})
+        run_args['on_tally'] = matrix.update
+    # --counters / --profile: counters and phase times of every game played (and a cProfile dump)
+    profile = sim_profile.empty_profile(profile_mode) if profile_mode else None
+    run_args['profile'] = profile
+    # --mirror: every game also played with seats swapped on the same dice;
+    # --compare-units: every game also played with a units.json variant (common random numbers)
+    run_args['mirror'] = mirror
+    if compare_units:
+        run_args['variant'] = sim_data.load_units_variant(compare_units, data)
+    if precision is None:
+        tallies = sim_runner.run_matchups(Game, pairs, n_games, units, cards, **run_args)
+    else:
+        # Adaptive: --games is the average budget per pair
+        tallies = sim_runner.run_adaptive(Game, pairs, n_games * len(pairs), units, cards, precision=precision, **run_args)
+    if store:
+        store.close()
+    if matrix:
+        matrix.close()
+
+    for (f1, f2), t in zip(pairs, tallies):
         code1 = f1['code']
         code2 = f2['code']
-        # print(f"Simulating {code1} vs {code2}...")
-        
-        for _ in range(n_games):
-            # Run 2 games per pair to swap first player advantage if any (though simultaneous turns here)
-            # Just plain loop
-            g = Game(f1, f2, units, cards, use_heroes=args.heroes)
-            if first_run:
-                g.verbose = True
-                g.log_event(f"--- Debug Game: {code1} vs {code2} ---")
-                first_run = False
-            
-            winner = g.run()
-            # print(f"Game {code1} vs {code2} -> Winner: {winner} (Turns: {g.turn_count})")
-            
-            if winner == code1:
-                results[code1][code2] += 1
-                results[code1]['total_wins'] += 1
-                results[code1]['win_turns'] += g.turn_count
-            elif winner == code2:
-                results[code2][code1] += 1
-                results[code2]['total_wins'] += 1
-                results[code2]['win_turns'] += g.turn_count
-            else:
-                results[code1]['draws'] += 1
-                results[code2]['draws'] += 1
+        results[code1][code2] += t['wins1']
+        results[code1]['total_wins'] += t['wins1']
+        results[code1]['win_turns'] += t['turns1']
+        results[code2][code1] += t['wins2']
+        results[code2]['total_wins'] += t['wins2']
+        results[code2]['win_turns'] += t['turns2']
+        results[code1]['draws'] += t['draws']
+        results[code2]['draws'] += t['draws']
 
     # Analysis Report
     print("# Informe de Balance y Simulación")
-    print(f"Total de partidas por emparejamiento: {n_games}")
+    if report_only:
+        # What the store holds, which may be less than --games
+        counts = [t['games'] for t in tallies]
+        per_pair = str(min(counts)) if min(counts) == max(counts) else f"{min(counts)}-{max(counts)}"
+        print(f"Partidas leídas del almacén: {sum(counts)} ({per_pair} por emparejamiento)")
+    elif precision is None:
+        print(f"Total de partidas por emparejamiento: {n_games}")
+    else:
+        print(f"Modo adaptativo: ±{precision:.1%} (IC 95%) | Partidas jugadas: {sum(t['games'] for t in tallies)} de {n_games * len(pairs)}")
+    if store:
+        reused = sum(1 for t in tallies if t['games'] and t['cached'] == t['games'])
+        print(f"Emparejamientos reutilizados del almacén: {reused}/{len(pairs)}")
     print("\n## Resultados por Facción\n")
     
     sorted_factions = sorted(valid_factions, key=lambda x: results[x['code']]['total_wins'], reverse=True)
@@ -311,18 +582,69 @@ def run_simulations(n_games):
         print(f"- Victorias Totales: {wins}")
         print(f"- Empates: {draws}")
         print(f"- Turnos Medios (Victoria): {avg_turns:.1f}")
+        for f_opp in valid_factions:
+            if f_opp == f: continue
+            opp_code = f_opp['code']
+            print(f"  - vs {opp_code}: {results[code].get(opp_code, 0)} victorias, {results[opp_code].get(code, 0)} derrotas")
         print("")
-        # for f_opp in valid_factions:
-        #    if f_opp == f: continue
-        #    opp_code = f_opp['code']
-        #    # wins_vs = results[code].get(opp_code, 0)
-        #    # print(f"  vs {opp_code}: {wins_vs}") 
+
+    if precision is not None:
+        print("## Emparejamientos (% victorias del primero, empate = 1/2, IC 95% Wilson)\n")
+        for (f1, f2), t in zip(pairs, tallies):
+            score = sim_runner.pair_score(t)
+            lo, hi = sim_runner.wilson_interval(score, t['games'])
+            print(f"- {f1['code']} vs {f2['code']}: {score:.1%} [{lo:.1%}, {hi:.1%}] (n={t['games']})")
+        print("")
+
+    if mirror or compare_units:
+        print("## Muestreo emparejado\n")
+        if compare_units:
+            print(f"- Variante: {compare_units} (diferencia = variante - actual, IC 95%)")
+        for line in sim_runner.paired_lines(pairs, tallies, mirror, lang="es"):
+            print(f"- {line}")
+        print("")
+
+    if profile:
+        print("## Perfil\n")
+        for line in sim_profile.report_lines(profile, lang="es"):
+            print(f"- {line}")
+        if profile_path and profile['pstats']:
+            sim_profile.dump_pstats(profile, profile_path)
+            print(f"- cProfile: {profile_path}")
         print("")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--games", type=int, default=100, help="Number of games per matchup")
     parser.add_argument("--heroes", action="store_true", help="Include heroes in armies")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed (same seed = same report for any --workers)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--dice", choices=sim_dice.DICE_MODES, default="roll", help="roll: every die, table: exact outcome table per attack")
+    parser.add_argument("--cards", choices=sim_cards.CARD_MODES, default="deck",
+                        help="deck: play command cards from cards.json, abstract: 3 units of the busiest section")
+    parser.add_argument("--debug", action="store_true", help="Print the events of the first game")
+    parser.add_argument("--trace", default=None, help="Directory for JSONL event traces of every game")
+    parser.add_argument("--precision", type=float, default=None,
+                        help="Adaptive mode: play each pair until its 95%% interval is within +-PRECISION "
+                             "(--games becomes the average budget per pair)")
+    parser.add_argument("--store", default=None,
+                        help="SQLite results store: skip games already played, save new ones (seed defaults to 0)")
+    parser.add_argument("--report-only", action="store_true", help="Only report what the --store already holds")
+    parser.add_argument("--data-dir", default=None, help="Folder with units.json, factions.json and cards.json")
+    parser.add_argument("--matrix", action="append", default=None,
+                        help="Write the N x N matchup matrix here (.csv, .json or .md), updated live; repeatable")
+    parser.add_argument("--counters", action="store_true", help="Report engine counters and time per phase")
+    parser.add_argument("--profile", default=None, help="Same as --counters, plus a cProfile (pstats) dump to this file")
+    parser.add_argument("--mirror", action="store_true",
+                        help="Also play every game with seats swapped on the same dice (--games counts game pairs)")
+    parser.add_argument("--compare-units", default=None,
+                        help="A/B: also play every game with this units.json, on the same dice (no --store)")
     args = parser.parse_args()
     
-    run_simulations(args.games)
+    run_simulations(args.games, args.heroes, seed=args.seed, workers=args.workers, dice_mode=args.dice,
+                    debug=args.debug, trace_dir=args.trace, precision=args.precision,
+                    store_path=args.store, report_only=args.report_only, data_dir=args.data_dir,
+                    matrix_paths=args.matrix, card_mode=args.cards,
+                    profile_mode=sim_profile.CPROFILE if args.profile else sim_profile.COUNTERS if args.counters else None,
+                    profile_path=args.profile,
+                    mirror=args.mirror, compare_units=args.compare_units)
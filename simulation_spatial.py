@@ -1,15 +1,25 @@
-import json
 import random
+import hashlib
 import argparse
-import os
-import math
 from collections import defaultdict
 from enum import Enum
 
+import sim_agents
+import sim_cards
+import sim_data
+import sim_dice
+import sim_map
+import sim_path
+import sim_profile
+import sim_report
+import sim_runner
+import sim_store
+from sim_events import EV_HIT, EV_KILL, EV_MOVE, EV_CARD, EV_END
+
 # --- Constants & Enums ---
 
-GRID_COLS = 13
-GRID_ROWS = 9
+# Bump whenever game logic changes: cached results of older versions are not reused
+ENGINE_VERSION = 5
 
 class UnitType(Enum):
     LIGHT = "light"
@@ -17,246 +27,363 @@ class UnitType(Enum):
     HEAVY = "heavy"
     ELITE = "elite"
 
-class DieFace(Enum):
-    SWORD = "sword"   # 1
-    FLAG = "flag"     # 2
-    CIRCLE = "circle" # 3 (Light)
-    TRIANGLE = "triangle" # 4 (Medium)
-    SQUARE = "square" # 5 (Heavy)
-    MAGIC = "magic"   # 6
-
-DICE_FACES = [
-    DieFace.SWORD, DieFace.FLAG, DieFace.CIRCLE,
-    DieFace.TRIANGLE, DieFace.SQUARE, DieFace.MAGIC
-]
+UNIT_TYPE_VALUES = {t.value for t in UnitType}
 
 SECTION_LEFT = "left"
 SECTION_CENTER = "center"
 SECTION_RIGHT = "right"
 
-# --- Hex Logic (Offset Coordinates: Odd-r layout usually for C&C or generic) ---
-# Actually, standard visual is stagger. Let's assume "Odd-r" (shoves odd rows right).
-# Distance using Cube Coordinates.
-
-def offset_to_cube(col, row):
-    # odd-r conversion
-    x = col - (row - (row & 1)) // 2
-    z = row
-    y = -x - z
-    return (x, y, z)
-
-def hex_distance(a, b):
-    # a, b are (col, row) tuples
-    ac = offset_to_cube(*a)
-    bc = offset_to_cube(*b)
-    return max(abs(ac[0] - bc[0]), abs(ac[1] - bc[1]), abs(ac[2] - bc[2]))
-
-def get_section(col):
-    if col <= 3: return SECTION_LEFT
-    if col >= 9: return SECTION_RIGHT
-    return SECTION_CENTER
-
-# --- Data Loading ---
-
-def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+# --- Board ---
+# Hex geometry, terrain and line of sight live in sim_map: every game plays on a
+# compiled sim_map.Board, the empty standard 13x9 map unless a map is given.
 
 # --- Classes ---
 
 class Unit:
+    # Battle state only (slots, integer type code); names and other metadata in info
+    __slots__ = ('id', 'type', 'type_code', 'max_strength', 'current_strength', 'movement', 'range_val',
+                 'is_hero', 'info', 'pos', 'owner', 'index')
+
     def __init__(self, data, faction_id):
         self.id = data['id']
-        self.name_es = data['name']['es']
-        self.faction = faction_id
-        self.type = UnitType(data['type']) if data['type'] in [t.value for t in UnitType] else UnitType.MEDIUM
-        self.subtype = data.get('subtype', 'unit')
+        self.type = UnitType(data['type']) if data['type'] in UNIT_TYPE_VALUES else UnitType.MEDIUM
+        subtype = data.get('subtype', 'unit')
         
         self.max_strength = data.get('strength', 4)
         self.current_strength = self.max_strength
         self.movement = data.get('movement', 2)
         self.range_val = data.get('range', 1)
-        self.cost = data.get('cost', 0)
+        cost = data.get('cost', 0)
         
-        self.is_hero = "Hero" in data.get('traits', []) or self.cost >= 6 or self.subtype == 'hero'
+        self.is_hero = "Hero" in data.get('traits', []) or cost >= 6 or subtype == 'hero'
         if self.is_hero: self.type = UnitType.ELITE
+        self.type_code = sim_dice.TYPE_CODE[self.type.value]
 
         self.pos = None # (col, row)
         self.owner = None # 1 or 2
+        self.index = None # order in Game.units (tie-break for equidistant targets)
+        
+        # Only needed for logging and reports; one dict per definition, shared by the clones,
+        # so units of a patched or compared units.json keep their own
+        self.info = {'name_es': data['name']['es'], 'faction': faction_id, 'subtype': subtype, 'cost': cost}
+
+    @property
+    def name_es(self): return self.info['name_es']
+
+    @property
+    def faction(self): return self.info['faction']
+
+    @property
+    def subtype(self): return self.info['subtype']
+
+    @property
+    def cost(self): return self.info['cost']
     
+    def clone(self):
+        # Fresh copy of a template unit: every slot is an immutable scalar
+        u = Unit.__new__(Unit)
+        u.id = self.id
+        u.type = self.type
+        u.type_code = self.type_code
+        u.max_strength = self.max_strength
+        u.current_strength = self.current_strength
+        u.movement = self.movement
+        u.range_val = self.range_val
+        u.is_hero = self.is_hero
+        u.info = self.info
+        u.pos = self.pos
+        u.owner = self.owner
+        u.index = self.index
+        return u
+
     def is_alive(self):
         return self.current_strength > 0
 
     def take_damage(self, hits):
         self.current_strength = max(0, self.current_strength - hits)
 
-    def can_be_hit_by(self, face):
-        if face == DieFace.SWORD: return True
-        if self.type == UnitType.LIGHT and face in [DieFace.CIRCLE, DieFace.MAGIC]: return True
-        if self.type == UnitType.MEDIUM and face == DieFace.TRIANGLE: return True
-        if self.type == UnitType.HEAVY and face == DieFace.SQUARE: return True
-        return False
+class ArmyTemplate:
+    # Compiled once per (units data, faction, heroes, army); build() clones fresh Units for each game
+    def __init__(self, faction_code, units_data, use_heroes=False, army=None):
+        self.faction_code = faction_code
+        self.units = []
+
+        # Point-buy army (sim_army): (unit id, copies) pairs instead of the box set below
+        if army is not None:
+            defs = {u['id']: u for u in units_data}
+            for unit_id, count in army:
+                for _ in range(count):
+                    self.units.append(Unit(defs[unit_id], faction_code))
+            return
+        
+        faction_units_defs = [u for u in units_data if u['faction'] == faction_code and u['expansion'] == 'base']
+        
+        # Standard Units
+        for u_def in faction_units_defs:
+            count = 2 if u_def.get('cost', 0) < 4 else 1
+            for _ in range(count):
+                self.units.append(Unit(u_def, faction_code))
+
+        # Hero Addition
+        if use_heroes:
+            # Find hero for this faction
+            hero_def = next((u for u in units_data if u['faction'] == faction_code and u.get('subtype') == 'hero'), None)
+            if hero_def:
+                self.units.append(Unit(hero_def, faction_code))
+
+    def build(self):
+        return [u.clone() for u in self.units]
+
+    def fingerprint(self):
+        # Hash of the battle-relevant compiled army (not names or rules text)
+        state = [(u.id, u.type_code, u.max_strength, u.movement, u.range_val, u.is_hero) for u in self.units]
+        return hashlib.sha256(repr(state).encode('utf-8')).hexdigest()[:16]
+
+_army_templates = {}
+
+def get_army_template(faction_code, units_data, use_heroes=False, army=None):
+    # Keyed on the units_data object itself: reloading units.json gives a new template
+    key = (id(units_data), faction_code, use_heroes, army)
+    entry = _army_templates.get(key)
+    if entry is None or entry[0] is not units_data:
+        entry = (units_data, ArmyTemplate(faction_code, units_data, use_heroes, army))
+        _army_templates[key] = entry
+    return entry[1]
 
 class Game:
-    def __init__(self, faction1_def, faction2_def, units_data, cards_data, use_heroes=False):
+    engine = "spatial" # Results store key
+    unit_cls = Unit # sim_army classifies units.json entries with it
+    version = ENGINE_VERSION
+
+    @staticmethod
+    def army_fingerprint(faction_code, units_data, use_heroes=False, army=None):
+        return get_army_template(faction_code, units_data, use_heroes, army).fingerprint()
+
+    @staticmethod
+    def profile_hooks():
+        # sim_profile wrappers, only installed while profiling (kinds in sim_profile)
+        return [
+            ('phase', 'game', Game, 'run'),
+            ('phase', 'setup', Game, '__init__'),
+            ('phase', 'cards', Game, 'play_card'),
+            ('phase', 'cards', Game, 'abstract_activations'),
+            ('phase', 'movement', Game, 'advance_unit'),
+            ('phase', 'combat', Game, 'resolve_combat'),
+            ('phase', 'victory', Game, 'alive_count'),
+            ('dice', 'dice', sim_dice.DiceEngine, 'hits_flags'),
+            ('dice', 'dice', sim_dice.DiceEngine, '_table_hits_flags'),
+            ('count', 'attacks', Game, 'resolve_combat'),
+            ('move', 'moves', Game, 'advance_unit', 'pos'),
+            ('count', 'get_closest_enemy', Game, 'get_closest_enemy'),
+            ('count', 'distance_fields', sim_path, 'distance_field'),
+        ]
+
+    def __init__(self, faction1_def, faction2_def, units_data, cards_data, use_heroes=False, rng=None, dice_mode="roll",
+                 card_mode="deck", map_code=None, terrain_data=None, armies=None, agents=None):
+        self.rng = rng or random.Random()
+        # map_code: MapEditorView map ("sizeCode|terrain"), compiled once per map with terrain_data (terrain.json)
+        self.board = sim_map.get_board(map_code, terrain_data)
+        # dice_mode: "roll" draws every face, "table" samples exact outcome tables (1 rng call/attack)
+        self.dice = sim_dice.DiceEngine(self.rng, mode=dice_mode)
         self.units = [] # All units in a flat list
         self.cards_data = cards_data
         self.turn_count = 0
         self.max_turns = 200
-        self.verbose = False
+        self.events = None # Optional sim_events sink (None = no logging cost)
         
         self.p1_faction = faction1_def['code']
         self.p1_medals = 0
         self.p2_faction = faction2_def['code']
         self.p2_medals = 0
         
+        # Occupancy grid: grid[row][col] -> living Unit or None
+        board = self.board
+        self.grid = [[None] * board.cols for _ in range(board.rows)]
+        # Occupancy bitsets: occupied[owner] has the sim_map bit of every hex holding one of its units
+        self.occupied = {1: 0, 2: 0}
+        # sim_path distance field towards the enemies of _field_key[0], at the layout _field_key[1]
+        self._field = None
+        self._field_key = None
+        # Live rosters: alive[owner] -> living units, in Game.units order
+        self.alive = {1: [], 2: []}
+        
         # Setup Armies
-        self._setup_player(1, self.p1_faction, units_data, use_heroes)
-        self._setup_player(2, self.p2_faction, units_data, use_heroes)
+        # armies: {faction code: point-buy army} (sim_army); other factions field the box set
+        armies = armies or {}
+        self._setup_player(1, self.p1_faction, units_data, use_heroes, armies.get(self.p1_faction))
+        self._setup_player(2, self.p2_faction, units_data, use_heroes, armies.get(self.p2_faction))
+        self.owners = [u.owner for u in self.units] # For sim_agents.GameState
 
-    def _setup_player(self, player_num, faction_code, units_data, use_heroes):
-        faction_units_defs = [u for u in units_data if u['faction'] == faction_code and u['expansion'] == 'base']
-        
-        my_units = []
-        for u_def in faction_units_defs:
-            count = 2 if u_def.get('cost', 0) < 4 else 1
-            for _ in range(count):
-                u = Unit(u_def, faction_code)
-                u.owner = player_num
-                my_units.append(u)
-        
-        # Add Hero
-        if use_heroes:
-            hero_def = next((u for u in units_data if u['faction'] == faction_code and u.get('subtype') == 'hero'), None)
-            if hero_def:
-                u = Unit(hero_def, faction_code)
-                u.owner = player_num
-                my_units.append(u)
+        # card_mode: "deck" plays real command cards from cards.json, "abstract" the old 3 random activations
+        self.mana = {1: 0, 2: 0}
+        self.hands = {1: [], 2: []}
+        self.deck = None
+        if card_mode == "deck":
+            self.deck = sim_cards.Deck(sim_cards.get_deck_template(cards_data), self.rng)
+            self.deck.draw_into(self.hands[1], sim_cards.HAND_SIZE)
+            self.deck.draw_into(self.hands[2], sim_cards.HAND_SIZE)
+        # agents: {faction code: agent or spec} choosing that faction's cards (sim_agents); None = heuristic
+        self.agents = sim_agents.make_agents(agents)
+
+    def _setup_player(self, player_num, faction_code, units_data, use_heroes, army=None):
+        my_units = get_army_template(faction_code, units_data, use_heroes, army).build()
+        for u in my_units:
+            u.owner = player_num
         
-        # Deployment (Fill rows 0,1 for P1; 8,7 for P2)
-        base_row = 0 if player_num == 1 else 8
-        second_row = 1 if player_num == 1 else 7
+        # Deployment: passable hexes of the two rows on the player's edge (0,1 for P1; last two for P2),
+        # further rows only if the map leaves too few
+        board = self.board
+        rows = range(board.rows) if player_num == 1 else range(board.rows - 1, -1, -1)
         
         # Shuffle for random deployment
-        random.shuffle(my_units)
+        self.rng.shuffle(my_units)
         
         possible_pos = []
-        for c in range(GRID_COLS): possible_pos.append((c, base_row))
-        for c in range(GRID_COLS): possible_pos.append((c, second_row))
+        for i, r in enumerate(rows):
+            if i >= 2 and len(possible_pos) >= len(my_units): break
+            possible_pos.extend((c, r) for c in range(board.cols) if board.cost[(c, r)] is not None)
         
         for i, u in enumerate(my_units):
             if i < len(possible_pos):
-                u.pos = possible_pos[i]
+                u.index = len(self.units)
+                self.place_unit(u, possible_pos[i])
                 self.units.append(u)
+                self.alive[player_num].append(u)
 
-    def get_alive_units(self, owner_filter=None):
-        return [u for u in self.units if u.is_alive() and (owner_filter is None or u.owner == owner_filter)]
+    def place_unit(self, unit, pos):
+        bits = self.board.bits
+        if unit.pos is not None:
+            self.occupied[unit.owner] ^= bits[unit.pos]
+            if self.grid[unit.pos[1]][unit.pos[0]] is unit:
+                self.grid[unit.pos[1]][unit.pos[0]] = None
+        unit.pos = pos
+        self.grid[pos[1]][pos[0]] = unit
+        self.occupied[unit.owner] |= bits[pos]
 
-    def roll_dice(self, count):
-        return [random.choice(DICE_FACES) for _ in range(count)]
+    def remove_unit(self, unit):
+        # Called when a unit dies
+        self.grid[unit.pos[1]][unit.pos[0]] = None
+        self.occupied[unit.owner] &= ~self.board.bits[unit.pos]
+        self.alive[unit.owner].remove(unit)
+
+    def alive_count(self, owner):
+        return len(self.alive[owner])
 
     def resolve_combat(self, attacker, defender):
-        dist = hex_distance(attacker.pos, defender.pos)
+        board = self.board
+        dist = board.distances[attacker.pos][defender.pos]
         
-        # Validate Range
-        if dist > attacker.range_val:
+        # Validate Range and line of sight
+        if not board.can_fire(attacker.pos, defender.pos, attacker.range_val):
             return 0, 0 # Can't hit
             
         dice_count = attacker.current_strength
         
-        # Ranged Penalty (New Rule: -1 if not adjacent)
-        if dist > 1:
+        # Ranged Penalty (New Rule: -1 if not adjacent; not from high ground)
+        if dist > 1 and not board.high_ground[attacker.pos]:
             dice_count = max(1, dice_count - 1)
+        if not board.plain:
+            dice_count = max(1, dice_count + board.dice_modifier(attacker.pos, defender.pos))
             
-        rolls = self.roll_dice(dice_count)
-        hits = 0
-        flags = 0
-        
-        for face in rolls:
-            if defender.can_be_hit_by(face): hits += 1
-            elif face == DieFace.FLAG: flags += 1
+        hits, flags = self.dice.hits_flags(dice_count, defender.type_code)
             
         defender.take_damage(hits)
+        if not defender.is_alive():
+            self.remove_unit(defender)
         return hits, flags
 
-    def get_closest_enemy(self, unit):
-        enemies = self.get_alive_units(owner_filter=3-unit.owner)
-        if not enemies: return None, 999
-        
+    def get_closest_enemy(self, unit, max_range):
+        # Closest enemy the unit can attack from here: the range band (line of
+        # sight included) AND the enemy occupancy, then a walk over the set bits.
+        # Ties go to the unit listed first in self.units.
+        board = self.board
+        dists = board.distances[unit.pos]
         best = None
         min_dist = 999
-        for e in enemies:
-            d = hex_distance(unit.pos, e.pos)
-            if d < min_dist:
+        targets = board.fire_mask(unit.pos, max_range) & self.occupied[3 - unit.owner]
+        hexes = board.hexes
+        grid = self.grid
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            pos = hexes[low.bit_length() - 1]
+            e = grid[pos[1]][pos[0]]
+            d = dists[pos]
+            if d < min_dist or (d == min_dist and e.index < best.index):
                 min_dist = d
                 best = e
         return best, min_dist
 
-    def move_unit_towards(self, unit, target_pos):
-        # Move 1 hex at a time towards target until movement exhausted
-        current = unit.pos
-        moves_left = unit.movement
-        
-        while moves_left > 0:
-            # Get neighbors
-            # Odd-r offset neighbors logic
-            col, row = current
-            is_odd = (row % 2) != 0
-            
-            # offsets for odd-r
-            even_offsets = [(1,0), (1,-1), (0,-1), (-1,0), (0,1), (1,1)]
-            odd_offsets = [(1,0), (0,-1), (-1,-1), (-1,0), (-1,1), (0,1)]
-            offsets = odd_offsets if is_odd else even_offsets
-            
-            best_next = None
-            best_dist = hex_distance(current, target_pos)
-            
-            for dx, dy in offsets:
-                nx, ny = col + dx, row + dy
-                # Check bounds
-                if 0 <= nx < GRID_COLS and 0 <= ny < GRID_ROWS:
-                    # Check occupancy
-                    occupied = any(u.pos == (nx, ny) and u.is_alive() for u in self.units)
-                    if not occupied:
-                        d = hex_distance((nx, ny), target_pos)
-                        if d < best_dist:
-                            best_dist = d
-                            best_next = (nx, ny)
-            
-            if best_next:
-                current = best_next
-                moves_left -= 1
-                # If reached target (collision), stop - logic handled by occupancy check implies we stop adjacent
-            else:
-                break # Blocked
+    def advance_unit(self, unit):
+        # Walk down the distance field towards the nearest enemy. The field is
+        # shared by the whole side and only rebuilt when the enemies move or die.
+        board = self.board
+        key = (unit.owner, self.occupied[3 - unit.owner])
+        if key != self._field_key:
+            self._field = sim_path.distance_field(board, key[1])
+            self._field_key = key
+        end = sim_path.follow(board, self._field, board.index[unit.pos], unit.movement,
+                              self.occupied[1] | self.occupied[2])
+        current = board.hexes[end]
                 
-        unit.pos = current
+        if self.events and current != unit.pos:
+            self.events.emit((EV_MOVE, self.turn_count, unit.owner, unit.id, unit.pos, current))
+        self.place_unit(unit, current)
+
+    def turn_mana(self, player_num):
+        # Mana for the card of player_num's next turn: +1 and the held altars
+        mana = self.mana[player_num] + 1
+        for (c, r), gain in self.board.altars:
+            if self.grid[r][c] is not None and self.grid[r][c].owner == player_num:
+                mana += gain
+        return min(sim_cards.MAX_MANA, mana)
 
-    def play_turn(self, player_num):
-        units = self.get_alive_units(player_num)
+    def play_turn(self, player_num, choice=None):
+        # choice: (hand index, option) to play instead of asking the agent / heuristic
+        units = self.alive[player_num] # Only enemy units can die during our turn
         if not units: return
+        if self.agents and choice is None and self.deck:
+            agent = self.agents.get(self.p1_faction if player_num == 1 else self.p2_faction)
+            if agent:
+                choice = agent.choose_card(self, player_num)
+        board = self.board
+        self.mana[player_num] = self.turn_mana(player_num)
         
-        # Card Phase (Abstract): Pick section with most units and enemies nearby?
-        # Simplified: Activate 3 random units that have valid targets or need to move
-        
-        # Prioritize units that CAN attack
+        # Prioritize units that CAN attack (any enemy in their fire mask)
         can_attack = []
         needs_move = []
+        enemy_bits = self.occupied[3 - player_num]
         
         for u in units:
-            target, dist = self.get_closest_enemy(u)
-            if target:
-                if dist <= u.range_val:
-                    can_attack.append(u)
-                else:
-                    needs_move.append(u)
+            if board.fire_mask(u.pos, u.range_val) & enemy_bits:
+                can_attack.append(u)
+            elif enemy_bits:
+                needs_move.append(u)
         
-        # Select 3 activations
+        # Card Phase
+        if self.deck:
+            activations = self.play_card(player_num, can_attack + needs_move, choice)
+        else:
+            activations = self.abstract_activations(can_attack, needs_move)
+            
+        # Execute Actions
+        for u in activations:
+            # Attack if already in range, otherwise move towards the nearest enemy first
+            target, dist = self.get_closest_enemy(u, u.range_val)
+            if not target:
+                if not self.occupied[3 - player_num]: continue
+                self.advance_unit(u)
+                target, dist = self.get_closest_enemy(u, u.range_val)
+            if target:
+                self.attack(player_num, u, target)
+
+    def abstract_activations(self, can_attack, needs_move):
+        # Simplified: Activate 3 random units that have valid targets or need to move
         activations = []
         quota = 3
         
-        random.shuffle(can_attack)
-        random.shuffle(needs_move)
+        self.rng.shuffle(can_attack)
+        self.rng.shuffle(needs_move)
         
         while quota > 0 and (can_attack or needs_move):
             if can_attack:
@@ -264,52 +391,169 @@ class Game:
             elif needs_move:
                 activations.append(needs_move.pop(0))
             quota -= 1
-            
-        # Execute Actions
-        for u in activations:
-            target, dist = self.get_closest_enemy(u)
-            if not target: continue
-            
-            # Move if needed
-            if dist > u.range_val:
-                self.move_unit_towards(u, target.pos)
-                # Recalculate dist after move
-                target, dist = self.get_closest_enemy(u) # Re-evaluate nearest? Or stick to target
-                # Check if now in range
-                if target and hex_distance(u.pos, target.pos) <= u.range_val:
-                     hits, flags = self.resolve_combat(u, target)
-                     if hits > 0 and self.verbose:
-                         print(f"P{player_num} {u.name_es} hits {target.name_es} ({hits} dmg)")
-                     if not target.is_alive():
-                         if player_num == 1: self.p1_medals += 1
-                         else: self.p2_medals += 1
-
-            # Attack if already in range (and didn't just dash-melee unless allowed? Assume Move+Attack standard)
-            elif dist <= u.range_val:
-                 hits, flags = self.resolve_combat(u, target)
-                 if hits > 0 and self.verbose:
-                     print(f"P{player_num} {u.name_es} fires at {target.name_es} ({hits} dmg)")
-                 if not target.is_alive():
-                     if player_num == 1: self.p1_medals += 1
-                     else: self.p2_medals += 1
+        return activations
+
+    def play_card(self, player_num, ready, choice=None):
+        # Best card/option of the hand (or choice) over the units worth activating
+        # (ready: attackers first, then units that must move)
+        sections = self.board.sections[player_num]
+        by_section = {SECTION_LEFT: [], SECTION_CENTER: [], SECTION_RIGHT: []}
+        type_counts = [0] * len(sim_dice.UNIT_TYPES)
+        for u in ready:
+            by_section[sections[u.pos[0]]].append(u)
+            type_counts[u.type_code] += 1
+        roster = sim_cards.Roster(by_section, ready, type_counts, self.adjacent_allies)
+        
+        hand = self.hands[player_num]
+        i, option = choice or sim_cards.choose(hand, roster, self.mana[player_num])
+        card = hand.pop(i)
+        if self.events:
+            self.events.emit((EV_CARD, self.turn_count, player_num, card.id,
+                              "A" if option is card.options[0] else "B"))
+        if option.special:
+            self.mana[player_num] = min(sim_cards.MAX_MANA, self.mana[player_num] + option.mana_gain) - option.mana_cost
+            if option.spell == 'damage':
+                self.spell_damage(player_num, card.id, option.amount)
+            elif option.spell == 'heal':
+                self.spell_heal(player_num, option.amount)
+        sim_cards.refill(self.deck, hand, card, option)
+        return option.select(roster)
+
+    def adjacent_allies(self, unit):
+        grid = self.grid
+        return [grid[r][c] for c, r in self.board.neighbors[unit.pos]
+                if grid[r][c] is not None and grid[r][c].owner == unit.owner]
+
+    def spell_damage(self, player_num, card_id, strength):
+        # Area spell: `strength` dice on an enemy hex and every enemy next to it,
+        # centred where it catches the most enemies (first enemy on ties)
+        grid = self.grid
+        neighbors = self.board.neighbors
+        def area(e):
+            return [e] + [grid[r][c] for c, r in neighbors[e.pos]
+                          if grid[r][c] is not None and grid[r][c].owner != player_num]
+        enemies = self.alive[3 - player_num]
+        if not enemies:
+            return
+        targets = max((area(e) for e in enemies), key=len)
+        for target in targets:
+            hits, flags = self.dice.hits_flags(strength, target.type_code)
+            target.take_damage(hits)
+            if hits > 0 and self.events:
+                self.events.emit((EV_HIT, self.turn_count, player_num, card_id, target.id, hits, flags))
+            if not target.is_alive():
+                self.remove_unit(target)
+                if self.events:
+                    self.events.emit((EV_KILL, self.turn_count, player_num, target.id))
+                if player_num == 1: self.p1_medals += 1
+                else: self.p2_medals += 1
+
+    def spell_heal(self, player_num, amount):
+        # Most wounded unit (first in army order on ties)
+        wounded = max(self.alive[player_num], key=lambda u: u.max_strength - u.current_strength)
+        wounded.current_strength = min(wounded.max_strength, wounded.current_strength + amount)
+
+    def attack(self, player_num, u, target):
+        hits, flags = self.resolve_combat(u, target)
+        if hits > 0 and self.events:
+            self.events.emit((EV_HIT, self.turn_count, player_num, u.id, target.id, hits, flags))
+        if not target.is_alive():
+            if self.events:
+                self.events.emit((EV_KILL, self.turn_count, player_num, target.id))
+            if player_num == 1: self.p1_medals += 1
+            else: self.p2_medals += 1
+
+    def unit_info(self):
+        # unit id -> Unit.info of this game's units, for event sinks that print names
+        return {u.id: u.info for u in self.units}
+
+    def hand(self, player_num):
+        return self.hands[player_num]
+
+    # --- Fork / Restore (sim_agents) ---
+
+    def fork(self):
+        units = self.units
+        return sim_agents.GameState([u.current_strength for u in units], [u.pos for u in units], self.owners,
+                                    (self.p1_medals, self.p2_medals), (self.mana[1], self.mana[2]), self.turn_count,
+                                    (list(self.hands[1]), list(self.hands[2])), self.deck and self.deck.state(),
+                                    self.dice.state())
+
+    def restore(self, state):
+        # Grid, bitsets and rosters rebuilt from the unit fields. The
+        # distance field stays: it is keyed on the occupancy it was built for.
+        grid = self.grid
+        for owner in (1, 2):
+            for u in self.alive[owner]:
+                grid[u.pos[1]][u.pos[0]] = None
+            self.alive[owner].clear()
+            self.occupied[owner] = 0
+        bits = self.board.bits
+        for u, strength, pos in zip(self.units, state.strength, state.pos):
+            u.current_strength = strength
+            u.pos = pos
+            if strength > 0:
+                grid[pos[1]][pos[0]] = u
+                self.occupied[u.owner] |= bits[pos]
+                self.alive[u.owner].append(u)
+        self.p1_medals, self.p2_medals = state.medals
+        self.mana[1], self.mana[2] = state.mana
+        self.turn_count = state.turn
+        self.hands[1], self.hands[2] = list(state.hands[0]), list(state.hands[1])
+        if self.deck:
+            self.deck.restore(state.deck)
+        self.dice.restore(state.dice)
+
+    def use_rng(self, rng):
+        # Every random draw of the game (dice, deck, abstract activations) from rng from now on
+        self.rng = rng
+        self.dice.reseed(rng)
+        if self.deck:
+            self.deck.rng = rng
+
+    def half_turn(self, player_num, choice=None):
+        # One player's turn; True if it wins the game
+        self.play_turn(player_num, choice)
+        medals = self.p1_medals if player_num == 1 else self.p2_medals
+        return self.alive_count(3 - player_num) == 0 or medals >= 5
+
+    def advance(self, player_num, half_turns, choice=None):
+        # Rollouts: up to half_turns turns from the start of player_num's (already
+        # counted in turn_count), the first playing choice. The winner's number,
+        # 0 for a draw on turns, None if the game goes on
+        for h in range(half_turns):
+            if h and player_num == 1:
+                if self.turn_count >= self.max_turns:
+                    return 0 if self.p1_medals == self.p2_medals else (1 if self.p1_medals > self.p2_medals else 2)
+                self.turn_count += 1
+            if self.half_turn(player_num, None if h else choice):
+                return player_num
+            player_num = 3 - player_num
+        return None
 
     def run(self):
+        winner = self._play_game()
+        if self.events:
+            self.events.emit((EV_END, self.turn_count, winner))
+        return winner
+
+    def _play_game(self):
         while self.turn_count < self.max_turns:
             self.turn_count += 1
             
-            self.play_turn(1)
-            if len(self.get_alive_units(2)) == 0 or self.p1_medals >= 5: return self.p1_faction
+            if self.half_turn(1): return self.p1_faction
             
-            self.play_turn(2)
-            if len(self.get_alive_units(1)) == 0 or self.p2_medals >= 5: return self.p2_faction
+            if self.half_turn(2): return self.p2_faction
             
         return "draw" if self.p1_medals == self.p2_medals else (self.p1_faction if self.p1_medals > self.p2_medals else self.p2_faction)
 
-def run_simulations(n_games, use_heroes):
-    data_dir = "d:/Devel/Proyectos/personal/war-hex-echoes-of-magic/data"
-    units = load_json(os.path.join(data_dir, "units.json"))
-    factions = load_json(os.path.join(data_dir, "factions.json"))
-    cards = load_json(os.path.join(data_dir, "cards.json"))
+def run_simulations(n_games, use_heroes, seed=None, workers=1, dice_mode="roll", debug=False, trace_dir=None,
+                    precision=None, store_path=None, report_only=False, data_dir=None,
+                    matrix_paths=None, card_mode="deck", map_code=None, profile_mode=None, profile_path=None,
+                    mirror=False, compare_units=None):
+    # Validated JSON, compiled to a snapshot that is rebuilt when the sources change
+    data = sim_data.load(data_dir)
+    units, factions, cards = data.units, data.factions, data.cards
     
     valid_factions = [f for f in factions if f['code'] not in ['neutral', 'mercenaries', 'titans', 'inferno']]
     results = defaultdict(lambda: defaultdict(int))
@@ -319,25 +563,62 @@ def run_simulations(n_games, use_heroes):
         for j in range(i + 1, len(valid_factions)):
             pairs.append((valid_factions[i], valid_factions[j]))
             
-    print(f"Running Spatial Simulation (13x9 Grid)... Games per match: {n_games}")
+    # A results store is only reusable with a fixed seed: default to 0 there
+    if seed is None:
+        seed = 0 if store_path else sim_runner.new_seed()
+    store = sim_store.ResultsStore(store_path) if store_path else None
+    game_kwargs = {'dice_mode': dice_mode, 'card_mode': card_mode}
+    if map_code:
+        # Compiled here first, so a bad map fails before any worker starts
+        game_kwargs.update(map_code=map_code, terrain_data=data.terrain)
+    board = sim_map.get_board(map_code, data.terrain if map_code else None)
+    print(f"Running Spatial Simulation ({board.cols}x{board.rows} Grid{', custom map' if map_code else ''})... Games per match: {n_games} | Seed: {seed} | Workers: {workers} | Dice: {dice_mode} | Cards: {card_mode}")
     
-    for f1, f2 in pairs:
-        for _ in range(n_games):
-            g = Game(f1, f2, units, cards, use_heroes)
-            winner = g.run()
-            
-            if winner == f1['code']:
-                results[f1['code']]['wins'] += 1
-                results[f1['code']]['turns'] += g.turn_count
-            elif winner == f2['code']:
-                results[f2['code']]['wins'] += 1
-                results[f2['code']]['turns'] += g.turn_count
-            else:
-                results[f1['code']]['draws'] += 1
-                results[f2['code']]['draws'] += 1
+    run_args = dict(use_heroes=use_heroes, seed=seed, workers=workers, game_kwargs=game_kwargs,
+                    debug_first=debug, trace_dir=trace_dir, store=store, report_only=report_only,
+                    snapshot=data.path)
+    # --matrix: N x N matrix files, rewritten as chunks finish
+    matrix = None
+    if matrix_paths:
+        matrix = sim_report.MatrixWriter(matrix_paths, [(f1['code'], f2['code']) for f1, f2 in pairs],
+                                         meta={'engine': Game.engine, 'seed': seed, 'heroes': use_heroes, 'dice': dice_mode,
+                                               'cards': card_mode, 'map': map_code or ''})
+        run_args['on_tally'] = matrix.update
+    # --counters / --profile: counters and phase times of every game played (and a cProfile dump)
+    profile = sim_profile.empty_profile(profile_mode) if profile_mode else None
+    run_args['profile'] = profile
+    # --mirror: every game also played with seats swapped on the same dice;
+    # --compare-units: every game also played with a units.json variant (common random numbers)
+    run_args['mirror'] = mirror
+    if compare_units:
+        run_args['variant'] = sim_data.load_units_variant(compare_units, data)
+    if precision is None:
+        tallies = sim_runner.run_matchups(Game, pairs, n_games, units, cards, **run_args)
+    else:
+        tallies = sim_runner.run_adaptive(Game, pairs, n_games * len(pairs), units, cards, precision=precision, **run_args)
+    if store:
+        store.close()
+    if matrix:
+        matrix.close()
+
+    for (f1, f2), t in zip(pairs, tallies):
+        results[f1['code']]['wins'] += t['wins1']
+        results[f1['code']]['turns'] += t['turns1']
+        results[f2['code']]['wins'] += t['wins2']
+        results[f2['code']]['turns'] += t['turns2']
+        results[f1['code']]['draws'] += t['draws']
+        results[f2['code']]['draws'] += t['draws']
 
     # Report
     print(f"\n# Spatial Results (With Heroes: {use_heroes})")
+    if report_only:
+        # What the store holds, which may be less than --games
+        counts = [t['games'] for t in tallies]
+        per_pair = str(min(counts)) if min(counts) == max(counts) else f"{min(counts)}-{max(counts)}"
+        print(f"Games read from store: {sum(counts)} ({per_pair} per matchup)")
+    if store:
+        reused = sum(1 for t in tallies if t['games'] and t['cached'] == t['games'])
+        print(f"Matchups reused from store: {reused}/{len(pairs)}")
     rank = sorted(valid_factions, key=lambda x: results[x['code']]['wins'], reverse=True)
     for f in rank:
         code = f['code']
@@ -345,9 +626,54 @@ def run_simulations(n_games, use_heroes):
         avg_turns = results[code]['turns'] / wins if wins > 0 else 0
         print(f"{f['name']['es']}: {wins} Wins | Avg Turns: {avg_turns:.1f}")
 
+    if precision is not None:
+        print(f"\n# Matchups (adaptive +-{precision:.1%}, 95% Wilson CI, draw = 1/2) | Games: {sum(t['games'] for t in tallies)}")
+        for (f1, f2), t in zip(pairs, tallies):
+            score = sim_runner.pair_score(t)
+            lo, hi = sim_runner.wilson_interval(score, t['games'])
+            print(f"{f1['code']} vs {f2['code']}: {score:.1%} [{lo:.1%}, {hi:.1%}] (n={t['games']})")
+
+    if mirror or compare_units:
+        print("\n# Paired Sampling")
+        if compare_units:
+            print(f"Variant: {compare_units} (difference = variant - current, 95% CI)")
+        for line in sim_runner.paired_lines(pairs, tallies, mirror):
+            print(line)
+
+    if profile:
+        print("\n# Profile")
+        for line in sim_profile.report_lines(profile):
+            print(line)
+        if profile_path and profile['pstats']:
+            sim_profile.dump_pstats(profile, profile_path)
+            print(f"cProfile: {profile_path}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--games", type=int, default=100)
     parser.add_argument("--heroes", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--dice", choices=sim_dice.DICE_MODES, default="roll")
+    parser.add_argument("--cards", choices=sim_cards.CARD_MODES, default="deck")
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--trace", default=None)
+    parser.add_argument("--precision", type=float, default=None)
+    parser.add_argument("--store", default=None)
+    parser.add_argument("--report-only", action="store_true")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--matrix", action="append", default=None)
+    parser.add_argument("--map", default=None, help="MapEditorView map: 'sizeCode|terrain' or a permalink")
+    parser.add_argument("--counters", action="store_true", help="Report engine counters and time per phase")
+    parser.add_argument("--profile", default=None, help="Same as --counters, plus a cProfile (pstats) dump to this file")
+    parser.add_argument("--mirror", action="store_true",
+                        help="Also play every game with seats swapped on the same dice (--games counts game pairs)")
+    parser.add_argument("--compare-units", default=None,
+                        help="A/B: also play every game with this units.json, on the same dice (no --store)")
     args = parser.parse_args()
-    run_simulations(args.games, args.heroes)
+    run_simulations(args.games, args.heroes, seed=args.seed, workers=args.workers, dice_mode=args.dice,
+                    debug=args.debug, trace_dir=args.trace, precision=args.precision,
+                    store_path=args.store, report_only=args.report_only, data_dir=args.data_dir,
+                    matrix_paths=args.matrix, card_mode=args.cards, map_code=args.map,
+                    profile_mode=sim_profile.CPROFILE if args.profile else sim_profile.COUNTERS if args.counters else None,
+                    profile_path=args.profile, mirror=args.mirror, compare_units=args.compare_units)
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+import sim_data
+import sim_runner
+import simulation
+import simulation_spatial
+
+def end_state(game):
+    # Everything a finished game leaves behind, comparable with ==
+    state = game.fork()
+    return (state.strength, state.pos, state.medals, state.mana, state.turn, state.hands, state.deck)
+
+@pytest.mark.parametrize("game_cls", [simulation.Game, simulation_spatial.Game])
+@pytest.mark.parametrize("card_mode", ["deck", "abstract"])
+def test_fork_restore_round_trip(game_cls, card_mode):
+    # A rollout on other dice between fork and restore must leave no trace: the
+    # game then finishes exactly as the same seed does without interruption
+    data = sim_data.load()
+    f = data.factions_by_code
+    checked = 0
+    for code1, code2 in (("amazons", "orcs"), ("dwarves", "elves"), ("undead", "daemons")):
+        for i in range(4):
+            def new_game():
+                return game_cls(f[code1], f[code2], data.units, data.cards, card_mode=card_mode,
+                                rng=sim_runner.game_rng(5, code1, code2, i))
+            reference = new_game()
+            winner = reference.run()
+
+            game = new_game()
+            ended = False
+            for _ in range(3): # A few full turns in, as Game.run plays them
+                game.turn_count += 1
+                if game.half_turn(1) or game.half_turn(2):
+                    ended = True
+                    break
+            if ended:
+                continue
+            state, rng = game.fork(), game.rng
+            game.use_rng(random.Random(99))
+            game.turn_count += 1
+            game.advance(1, 8)
+            game.use_rng(rng)
+            game.restore(state)
+            assert game.run() == winner
+            assert end_state(game) == end_state(reference)
+            checked += 1
+    assert checked >= 6
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+
+import sim_data
+import sim_runner
+import simulation
+
+def copy_sources(tmp_path):
+    for name in sim_data.SOURCES:
+        shutil.copy(os.path.join(sim_data.DEFAULT_DATA_DIR, name), tmp_path / name)
+    return str(tmp_path)
+
+def test_snapshot_written_without_leftovers(tmp_path):
+    data_dir = copy_sources(tmp_path)
+    first = sim_data.compile_snapshot(data_dir)
+    second = sim_data.compile_snapshot(data_dir) # Same name replaced, own temp file each time
+    assert first.path == second.path == os.path.join(data_dir, sim_data.SNAPSHOT_NAME)
+    assert sorted(os.listdir(data_dir)) == sorted(sim_data.SOURCES + (sim_data.SNAPSHOT_NAME,))
+    assert sim_data.load(data_dir).units == first.units
+
+def test_unwritable_data_dir_falls_back_to_memory(tmp_path, monkeypatch):
+    data_dir = copy_sources(tmp_path)
+    def refuse(*args, **kwargs):
+        raise PermissionError("read-only")
+    monkeypatch.setattr(tempfile, 'mkstemp', refuse)
+    data = sim_data.load(data_dir)
+    assert data.path is None
+    assert not os.path.exists(os.path.join(data_dir, sim_data.SNAPSHOT_NAME))
+    # Without a snapshot the workers get a pickled copy of the data
+    pairs = [(data.factions_by_code['amazons'], data.factions_by_code['orcs'])]
+    tallies = sim_runner.run_matchups(simulation.Game, pairs, 4, data.units, data.cards, seed=1, workers=2,
+                                      snapshot=data.path)
+    assert tallies[0]['games'] == 4
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import sim_dice
+
+def rule_hits_flags(face, defender_type):
+    # The original Unit.can_be_hit_by rules: sword always hits, light is hit by
+    # circle and magic, medium by triangle, heavy by square; a flag that does
+    # not hit counts as a flag
+    hit = (face == sim_dice.FACE_SWORD
+           or defender_type == 'light' and face in (sim_dice.FACE_CIRCLE, sim_dice.FACE_MAGIC)
+           or defender_type == 'medium' and face == sim_dice.FACE_TRIANGLE
+           or defender_type == 'heavy' and face == sim_dice.FACE_SQUARE)
+    return int(hit), int(not hit and face == sim_dice.FACE_FLAG)
+
+@pytest.mark.parametrize("defender_type", sim_dice.UNIT_TYPES)
+def test_roll_engine_follows_face_rules(defender_type):
+    # Every face, alone and in a mixed roll, fed straight into the engine's buffer
+    engine = sim_dice.DiceEngine(random.Random(1))
+    code = sim_dice.TYPE_CODE[defender_type]
+    for face in sim_dice.FACE_CODES:
+        engine.restore((bytes([face]), 0))
+        assert engine.hits_flags(1, code) == rule_hits_flags(face, defender_type)
+        assert sim_dice.reference_hit(face, defender_type) == bool(rule_hits_flags(face, defender_type)[0])
+    faces = bytes(random.Random(2).choices(sim_dice.FACE_CODES, k=200))
+    engine.restore((faces, 0))
+    expected = [rule_hits_flags(f, defender_type) for f in faces]
+    assert engine.hits_flags(len(faces), code) == (sum(h for h, _ in expected), sum(f for _, f in expected))
+
+@pytest.mark.parametrize("defender_type", sim_dice.UNIT_TYPES)
+def test_outcome_tables_follow_face_rules(defender_type):
+    # Table mode samples outcome_table: its one-die odds must be the rules' face counts
+    hits = sum(rule_hits_flags(f, defender_type)[0] for f in sim_dice.FACE_CODES)
+    flags = sum(rule_hits_flags(f, defender_type)[1] for f in sim_dice.FACE_CODES)
+    table = sim_dice.outcome_table(1, defender_type)
+    assert table.get((1, 0), 0.0) == pytest.approx(hits / 6)
+    assert table.get((0, 1), 0.0) == pytest.approx(flags / 6)
+
+@pytest.mark.parametrize("mode", sim_dice.DICE_MODES)
+def test_engine_matches_per_die_reference(mode):
+    # Fixed seeds: the same samples every run, so a failure means the distributions drifted
+    assert sim_dice.check_equivalence(samples=20000, seed=1, mode=mode)
+
+def test_check_catches_wrong_mask(monkeypatch):
+    # The reference does not read HIT_FACES or the masks: a roll engine where
+    # magic no longer hits light units must fail the check
+    masks = list(sim_dice.HIT_MASK_BY_CODE)
+    masks[sim_dice.TYPE_CODE['light']] = sim_dice._hit_table((sim_dice.FACE_SWORD, sim_dice.FACE_CIRCLE))
+    monkeypatch.setattr(sim_dice, 'HIT_MASK_BY_CODE', tuple(masks))
+    assert not sim_dice.check_equivalence(samples=5000, seed=1)
+
+def test_check_catches_wrong_table(monkeypatch):
+    # Same for a wrong HIT_FACES entry feeding the exact outcome tables
+    monkeypatch.setitem(sim_dice.HIT_FACES, 'light', (sim_dice.FACE_SWORD, sim_dice.FACE_CIRCLE))
+    sim_dice.outcome_table.cache_clear()
+    sim_dice.cumulative_table.cache_clear()
+    try:
+        assert not sim_dice.check_equivalence(samples=5000, seed=1, mode="table")
+    finally:
+        sim_dice.outcome_table.cache_clear()
+        sim_dice.cumulative_table.cache_clear()
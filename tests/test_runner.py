@@ -0,0 +1,38 @@
+import sim_data
+import sim_runner
+import simulation
+
+def test_adaptive_mirror_odd_budget_ends():
+    # A mirrored game index costs two games: an odd budget leaves one game that
+    # no span can use, and the rounds must stop there instead of looping
+    data = sim_data.load()
+    f = data.factions_by_code
+    pairs = [(f['amazons'], f['orcs']), (f['dwarves'], f['elves'])]
+    for budget in (3, 5, 7):
+        tallies = sim_runner.run_adaptive(simulation.Game, pairs, budget, data.units, data.cards, seed=1,
+                                          precision=0.001, mirror=True)
+        played = sum(t['games'] for t in tallies)
+        assert played % 2 == 0
+        assert budget - 2 < played <= budget
+
+def test_same_seed_same_tallies_for_any_worker_count():
+    # Every game's RNG is keyed on (seed, pair, game index): how the games are
+    # split across processes must not change a single tally
+    data = sim_data.load()
+    f = data.factions_by_code
+    pairs = [(f['amazons'], f['orcs']), (f['dwarves'], f['elves']), (f['orcs'], f['elves'])]
+    runs = [sim_runner.run_matchups(simulation.Game, pairs, 12, data.units, data.cards, seed=7, workers=workers,
+                                    snapshot=data.path)
+            for workers in (1, 3)]
+    assert runs[0] == runs[1]
+    assert all(t['games'] == 12 for t in runs[0])
+
+def test_paired_lines_first_mover_only_when_mirrored():
+    data = sim_data.load()
+    f = data.factions_by_code
+    pairs = [(f['amazons'], f['orcs'])]
+    for mirror in (False, True):
+        tallies = sim_runner.run_matchups(simulation.Game, pairs, 4, data.units, data.cards, seed=1, mirror=mirror)
+        for lang, label in (("en", "First mover"), ("es", "mueve primero")):
+            lines = sim_runner.paired_lines(pairs, tallies, mirror, lang)
+            assert any(label in line for line in lines) == mirror